@@ -0,0 +1,58 @@
+"""
+Compares classification of input lines: is_ip/is_network/validate_domain chain with classify_target
+
+    python -m benchmarks.bench_classify [-n 200000]
+"""
+import argparse
+from random import Random
+from timeit import default_timer
+
+from lib.core import classify_target, validate_domain
+from lib.core.templates import validate_domain_1
+from lib.util import is_ip, is_network
+
+
+def create_lines(number: int):
+    """
+    Unique hostnames with some IP addresses, networks and IDN names, like feed of scan
+    """
+    random = Random(1)
+    lines = []
+    for i in range(number):
+        kind = random.random()
+        if kind < 0.8:
+            lines.append(f'host{i}.sub{random.randint(0, 999)}.example{i % 97}.com')
+        elif kind < 0.9:
+            lines.append(f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}')
+        elif kind < 0.93:
+            lines.append(f'2001:db8::{i:x}')
+        elif kind < 0.95:
+            lines.append(f'10.{(i >> 8) & 255}.{i & 255}.0/24')
+        elif kind < 0.97:
+            lines.append(f'пример{i}.рф')
+        else:
+            lines.append(f'not a host {i}')
+    return lines
+
+
+def validate_chain(line: str) -> bool:
+    return any([is_ip(line), is_network(line), validate_domain(line)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='input classification benchmark')
+    parser.add_argument('-n', dest='number', type=int, default=200000)
+    number = parser.parse_args().number
+    lines = create_lines(number)
+    for name, function in [('is_ip/is_network/validate_domain', validate_chain),
+                           ('classify_target', classify_target)]:
+        validate_domain.cache_clear()
+        validate_domain_1.cache_clear()
+        started = default_timer()
+        accepted = sum(1 for line in lines if function(line))
+        seconds = default_timer() - started
+        print(f'{name:<34} {seconds / number * 1e6:8.2f} us/line, accepted: {accepted}')
+
+
+if __name__ == '__main__':
+    main()
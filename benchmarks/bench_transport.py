@@ -0,0 +1,66 @@
+"""
+Requests per second of UDP socket pool against local responder which answers every query at once
+
+    python -m benchmarks.bench_transport [-n 200000] [-c 64] [--address 127.0.0.4]
+"""
+import argparse
+import asyncio
+from timeit import default_timer
+
+import uvloop
+
+from lib.core import pack_question
+from lib.workers import DnsSocketPool
+from lib.workers.pool import DNS_PORT
+
+
+class Responder(asyncio.DatagramProtocol):
+    """
+    Echoes query with QR flag, like nameserver with empty answer
+    """
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data[:2] + bytes([data[2] | 0x80]) + data[3:], addr)
+
+
+async def run(number: int, concurrency: int, address: str):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(Responder, local_addr=(address, DNS_PORT))
+    pool = DnsSocketPool()
+    payloads = [pack_question(f'host{i}.example.com') for i in range(concurrency)]
+    counter = iter(range(number))
+    timeouts = 0
+
+    async def sender(payload: bytes):
+        nonlocal timeouts
+        for _ in counter:
+            dns_socket = await pool.acquire(address)
+            try:
+                await dns_socket.request(payload, timeout=1)
+            except asyncio.TimeoutError:
+                timeouts += 1  # responses dropped by full socket buffers
+
+    started = default_timer()
+    await asyncio.gather(*[sender(payload) for payload in payloads])
+    seconds = default_timer() - started
+    pool.close()
+    transport.close()
+    print(f'{number} requests, {concurrency} concurrent: {number / seconds:10.0f} requests/s, '
+          f'{seconds / number * 1e6:6.2f} us/request, timeouts: {timeouts}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UDP transport benchmark')
+    parser.add_argument('-n', dest='number', type=int, default=200000)
+    parser.add_argument('-c', dest='concurrency', type=int, default=64)
+    parser.add_argument('--address', dest='address', type=str, default='127.0.0.4')
+    args = parser.parse_args()
+    uvloop.install()
+    asyncio.run(run(args.number, args.concurrency, args.address))
+
+
+if __name__ == '__main__':
+    main()
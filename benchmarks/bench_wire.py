@@ -0,0 +1,41 @@
+"""
+Compares dnslib with lib.core.wire: packing questions and parsing responses
+
+    python -m benchmarks.bench_wire [-n 20000]
+"""
+import argparse
+from timeit import timeit
+
+from dnslib import DNSRecord, RR, QTYPE, A, CNAME, MX
+
+from lib.core import pack_question, parse_response, unpack_packet
+
+HOSTNAME = 'www.example.com'
+
+
+def create_response() -> bytes:
+    question = DNSRecord.question(HOSTNAME)
+    response = question.reply()
+    response.add_answer(RR(HOSTNAME, QTYPE.CNAME, rdata=CNAME('edge.example.net'), ttl=60))
+    for i in range(4):
+        response.add_answer(RR('edge.example.net', QTYPE.A, rdata=A(f'192.0.2.{i + 1}'), ttl=120))
+    response.add_answer(RR(HOSTNAME, QTYPE.MX, rdata=MX('mx.example.com', 10), ttl=120))
+    return bytes(response.pack())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dnslib vs wire benchmark')
+    parser.add_argument('-n', dest='number', type=int, default=20000)
+    number = parser.parse_args().number
+    response = create_response()
+    cases = [('pack: dnslib', lambda: DNSRecord.question(HOSTNAME, 'A').pack()),
+             ('pack: wire', lambda: pack_question(HOSTNAME, 'A')),
+             ('parse: dnslib', lambda: unpack_packet(response)),
+             ('parse: wire', lambda: parse_response(response))]
+    for name, function in cases:
+        seconds = timeit(function, number=number)
+        print(f'{name:<15} {seconds / number * 1e6:8.2f} us/op')
+
+
+if __name__ == '__main__':
+    main()
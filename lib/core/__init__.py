@@ -2,3 +2,6 @@ from .loading import *
 from .stats import *
 from .templates import *
 from .configs import *
+from .wire import *
+from .scheduler import *
+from .cache import *
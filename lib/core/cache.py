@@ -0,0 +1,103 @@
+import sqlite3
+from collections import OrderedDict
+from time import time
+from typing import Dict, Optional, Set, Tuple
+
+from .wire import response_ttl
+
+__all__ = ['AnswerCache']
+
+MAX_TTL = 86400
+
+CacheKey = Tuple[str, str]  # hostname, query type
+CacheValue = Tuple[bytes, str, float]  # response, nameserver, expires(unix time)
+
+
+class AnswerCache:
+    """
+    LRU cache of DNS responses keyed by (hostname, query type), entries expire by TTL of response.
+    With path entries are loaded from sqlite file on start and saved back by save()
+    """
+
+    def __init__(self, maxsize: int, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries: 'OrderedDict[CacheKey, CacheValue]' = OrderedDict()
+        self.changed: Set[CacheKey] = set()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, hostname: str, qtype: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Returns response and nameserver which sent it, None if there is no entry or it is expired
+        """
+        key = (hostname, qtype)
+        value = self.entries.get(key)
+        if value is None:
+            return None
+        response, nameserver, expires = value
+        if expires <= time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response, nameserver
+
+    def put(self, hostname: str, qtype: str, nameserver: str, response: bytes):
+        try:
+            ttl = response_ttl(response)
+        except Exception:
+            return
+        if not ttl:
+            return
+        key = (hostname, qtype)
+        self.entries[key] = (response, nameserver, time() + min(ttl, MAX_TTL))
+        self.entries.move_to_end(key)
+        if self.path:
+            self.changed.add(key)
+        while len(self.entries) > self.maxsize:
+            key, _ = self.entries.popitem(last=False)
+            self.changed.discard(key)
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE IF NOT EXISTS answers (hostname TEXT, qtype TEXT, nameserver TEXT, '
+                           'expires REAL, response BLOB, PRIMARY KEY (hostname, qtype))')
+        return connection
+
+    def load(self):
+        """
+        Loads not expired entries from sqlite file, most long-lived are loaded if there are more than maxsize
+        """
+        connection = self.connect()
+        try:
+            rows = connection.execute('SELECT hostname, qtype, nameserver, expires, response FROM answers '
+                                      'WHERE expires > ? ORDER BY expires DESC LIMIT ?', (time(), self.maxsize))
+            loaded: Dict[CacheKey, CacheValue] = {(hostname, qtype): (bytes(response), nameserver, expires)
+                                                  for hostname, qtype, nameserver, expires, response in rows}
+        finally:
+            connection.close()
+        self.entries.update(reversed(list(loaded.items())))
+
+    def save(self):
+        """
+        Saves new entries to sqlite file and removes expired ones
+        """
+        if not self.path:
+            return
+        rows = []
+        for hostname, qtype in self.changed:
+            value = self.entries.get((hostname, qtype))
+            if value:
+                response, nameserver, expires = value
+                rows.append((hostname, qtype, nameserver, expires, response))
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)', rows)
+                connection.execute('DELETE FROM answers WHERE expires <= ?', (time(),))
+        finally:
+            connection.close()
+        self.changed.clear()
@@ -1,12 +1,14 @@
 from collections import namedtuple
 from dataclasses import dataclass
-from typing import Iterator, List
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .scheduler import NameserverScheduler
 
 
 @dataclass(frozen=True)
 class AppConfig:
     senders: int
-    queue_sleep: int
+    queue_size: int
     statistics: bool
     input_stdin: str
     single_targets: str
@@ -16,17 +18,41 @@ class AppConfig:
     show_only_success: bool
     nameservers: Iterator
     query_types_are_supported: List[str]
-    timeout: int
-    use_msgpack: bool
+    split_queries: bool
+    timeout: float
+    retries: int
+    retry_backoff: float
+    qps: float
+    qps_per_nameserver: Dict[str, float]
+    max_inflight: int
+    max_inflight_per_nameserver: Dict[str, int]
+    cache_size: int
+    cache_file: Optional[str]
+    output_batch: int
+    flush_interval: float
+    output_format: str
+    compress: Optional[str]
+    compress_level: Optional[int]
+    sockets_per_nameserver: int
+    input_lines: Optional[Iterable[str]] = None  # in-memory input, used instead of input file
+    workers: int = 1
+    shard_by: str = 'hash'
+    checkpoint_file: Optional[str] = None
+    checkpoint_interval: float = 10.0
+    resume: bool = False
+    transport: str = 'udp'
+    edns_bufsize: int = 1232  # 0 - queries without EDNS0 OPT record
 
 
 @dataclass(frozen=True)
 class TargetConfig:
-    nameservers: Iterator
+    nameservers: NameserverScheduler
+    query_types: List[str]
+    edns_bufsize: int = 0
 
     def as_dict(self):
         nameserver = next(self.nameservers)
         return {'nameserver': nameserver}
 
 
-Target = namedtuple('Target', ['hostname', 'nameserver', 'payload'])
+Target = namedtuple('Target', ['hostname', 'nameserver', 'payload', 'qtype'])
@@ -0,0 +1,166 @@
+from random import choices
+from time import monotonic
+from typing import Callable, Dict, List, Optional
+
+__all__ = ['NameserverHealth', 'NameserverScheduler', 'OUTCOME_OK', 'OUTCOME_TIMEOUT', 'OUTCOME_ERROR']
+
+OUTCOME_OK = 'ok'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_ERROR = 'error'  # SERVFAIL, REFUSED
+
+EWMA_ALPHA = 0.1
+INITIAL_LATENCY = 0.05
+MIN_LATENCY = 0.001
+MIN_WEIGHT = 0.01
+EJECT_THRESHOLD = 0.5
+EJECT_MIN_SAMPLES = 20
+EJECT_TIME = 5.0
+EJECT_TIME_MAX = 120.0
+
+
+class NameserverHealth:
+    """
+    Health counters of one nameserver: EWMA of latency, timeout rate and SERVFAIL/REFUSED rate,
+    UDP payload size advertised in EDNS0 OPT records of its responses
+    """
+
+    def __init__(self, nameserver: str):
+        self.nameserver = nameserver
+        self.latency = INITIAL_LATENCY
+        self.timeout_rate = 0.0
+        self.error_rate = 0.0
+        self.count_queries = 0
+        self.count_timeouts = 0
+        self.count_errors = 0
+        self.samples = 0
+        self.ejected_until = 0.0
+        self.eject_time = EJECT_TIME
+        self.count_ejections = 0
+        self.probe_started = 0.0
+        self.edns = True  # cleared when nameserver answers FORMERR to query with OPT record
+        self.edns_bufsize: Optional[int] = None
+
+    @property
+    def weight(self) -> float:
+        failure = min(1.0, self.timeout_rate + self.error_rate)
+        return max(MIN_WEIGHT, (1.0 - failure) / max(self.latency, MIN_LATENCY))
+
+    def update(self, latency: Optional[float], outcome: str):
+        self.count_queries += 1
+        self.samples += 1
+        timeout, error = (outcome == OUTCOME_TIMEOUT), (outcome == OUTCOME_ERROR)
+        self.count_timeouts += timeout
+        self.count_errors += error
+        self.timeout_rate += EWMA_ALPHA * (timeout - self.timeout_rate)
+        self.error_rate += EWMA_ALPHA * (error - self.error_rate)
+        if latency is not None and outcome == OUTCOME_OK:
+            self.latency += EWMA_ALPHA * (latency - self.latency)
+
+    def dict(self) -> dict:
+        return {'queries': self.count_queries,
+                'timeouts': self.count_timeouts,
+                'errors': self.count_errors,
+                'latency': round(self.latency, 6),
+                'timeout rate': round(self.timeout_rate, 4),
+                'error rate': round(self.error_rate, 4),
+                'ejections': self.count_ejections,
+                'edns bufsize': self.edns_bufsize if self.edns else 0}
+
+
+class NameserverScheduler:
+    """
+    Chooses nameserver for every query, weighted by health.
+    Unhealthy nameservers are ejected for a while, then one probe query decides if they are back
+    """
+
+    def __init__(self, nameservers: List[str]):
+        self.nameservers = list(dict.fromkeys(nameservers))
+        self.health: Dict[str, NameserverHealth] = {nameserver: NameserverHealth(nameserver)
+                                                    for nameserver in self.nameservers}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return self.select()
+
+    def select(self, exclude: Optional[str] = None,
+               available: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """
+        Returns nameserver, exclude - nameserver which should not be selected if there are other not ejected ones.
+        available - check of nameserver limits, only not ejected nameservers which pass it are selected,
+        None if there are no such
+        """
+        now = monotonic()
+        candidates = []
+        for health in self.health.values():
+            if health.nameserver == exclude or (available and not available(health.nameserver)):
+                continue
+            if health.ejected_until:
+                if health.ejected_until > now or now - health.probe_started < EJECT_TIME:
+                    continue
+                # ejection is over: next query is a probe, lost probes are repeated after EJECT_TIME
+                health.probe_started = now
+                return health.nameserver
+            candidates.append(health)
+        if not candidates:
+            if available:
+                # throttled nameserver is replaced only with not ejected one, otherwise query waits for its limits
+                return None
+            candidates = [health for health in self.health.values() if health.nameserver != exclude] \
+                or list(self.health.values())
+            excluded = self.health.get(exclude)
+            if excluded and not excluded.ejected_until:
+                # the others are ejected: healthy excluded nameserver is better than dead one
+                return exclude
+            return min(candidates, key=lambda health: health.ejected_until).nameserver
+        if len(candidates) == 1:
+            return candidates[0].nameserver
+        return choices(candidates, weights=[health.weight for health in candidates])[0].nameserver
+
+    def report(self, nameserver: str, latency: Optional[float], outcome: str):
+        """
+        Updates health of nameserver after query
+        """
+        health = self.health.get(nameserver)
+        if not health:
+            return
+        health.update(latency, outcome)
+        if health.probe_started:
+            health.probe_started = 0.0
+            if outcome == OUTCOME_OK:
+                health.ejected_until = 0.0
+                health.eject_time = EJECT_TIME
+                health.timeout_rate = health.error_rate = 0.0
+                health.samples = 0
+            else:
+                health.eject_time = min(health.eject_time * 2, EJECT_TIME_MAX)
+                health.ejected_until = monotonic() + health.eject_time
+        elif not health.ejected_until and health.samples >= EJECT_MIN_SAMPLES \
+                and health.timeout_rate + health.error_rate >= EJECT_THRESHOLD \
+                and len(self.health) > 1:
+            health.ejected_until = monotonic() + health.eject_time
+            health.count_ejections += 1
+
+    def edns(self, nameserver: str) -> bool:
+        """
+        Returns False if queries to nameserver should be sent without OPT record
+        """
+        health = self.health.get(nameserver)
+        return health is None or health.edns
+
+    def report_edns(self, nameserver: str, edns_bufsize: Optional[int], supported: bool = True):
+        """
+        Records UDP payload size advertised by nameserver (None - response without OPT record).
+        Once nameserver is marked as not supporting EDNS0 it stays so, late replies to earlier queries do not matter
+        """
+        health = self.health.get(nameserver)
+        if not health:
+            return
+        if not supported:
+            health.edns = False
+        if edns_bufsize is not None:
+            health.edns_bufsize = edns_bufsize
+
+    def dict(self) -> dict:
+        return {nameserver: health.dict() for nameserver, health in self.health.items()}
@@ -1,25 +1,85 @@
 from datetime import datetime
 
-__all__ = ['Stats']
+__all__ = ['Stats', 'merge_stats']
 
-from typing import Optional
+from typing import Dict, List, Optional
+
+from .scheduler import NameserverScheduler
+
+AVERAGED = {'latency': 6, 'timeout rate': 4, 'error rate': 4}  # fields of nameserver health: digits after rounding
 
 
 class Stats:
     """
     Holds application counters and timestamps
     """
-    def __init__(self, start_time: datetime = None):
+    def __init__(self, start_time: datetime = None, nameservers: Optional[NameserverScheduler] = None):
         self.start_time = start_time or datetime.utcnow()
+        self.nameservers = nameservers
         self.count_input = 0
         self.count_good = 0
         self.count_error = 0
+        self.time_blocked = 0.0
+        self.count_retries = 0
+        self.count_cache_hits = 0
+        self.count_cache_misses = 0
+        self.count_coalesced = 0
+        self.count_tcp_fallbacks = 0
 
     def dict(self, stopped: Optional[datetime] = None) -> dict:
         stopped = stopped or datetime.utcnow()
-        return {
+        result = {
             'duration': (stopped - self.start_time).total_seconds(),
             'valid targets': self.count_input,
             'success': self.count_good,
-            'fails': self.count_error
+            'fails': self.count_error,
+            'retries': self.count_retries,
+            'cache hits': self.count_cache_hits,
+            'cache misses': self.count_cache_misses,
+            'coalesced': self.count_coalesced,
+            'tcp fallbacks': self.count_tcp_fallbacks,
+            'input blocked': round(self.time_blocked, 6)
         }
+        if self.nameservers:
+            result['nameservers'] = self.nameservers.dict()
+        return result
+
+
+def merge_stats(results: List[Dict]) -> Dict:
+    """
+    Aggregates Stats.dict() of several workers: counters are summed, duration is the longest one,
+    latency and rates of nameservers are averaged weighted by number of queries,
+    advertised EDNS buffer size is the largest one
+    """
+    merged: Dict = {}
+    nameservers: Dict[str, List[Dict]] = {}
+    for result in results:
+        for key, value in result.items():
+            if key == 'nameservers':
+                for nameserver, health in value.items():
+                    nameservers.setdefault(nameserver, []).append(health)
+            elif key == 'duration':
+                merged[key] = max(merged.get(key, 0), value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    if 'input blocked' in merged:
+        merged['input blocked'] = round(merged['input blocked'], 6)
+    if nameservers:
+        merged['nameservers'] = {}
+        for nameserver, healths in nameservers.items():
+            queries = sum(health['queries'] for health in healths)
+            merged_health = {}
+            for key in healths[0]:
+                if key in AVERAGED:
+                    if queries:
+                        value = sum(health[key] * health['queries'] for health in healths) / queries
+                    else:
+                        value = sum(health[key] for health in healths) / len(healths)
+                    merged_health[key] = round(value, AVERAGED[key])
+                elif key == 'edns bufsize':
+                    merged_health[key] = max((health[key] for health in healths if health[key] is not None),
+                                             default=None)
+                else:
+                    merged_health[key] = sum(health[key] for health in healths)
+            merged['nameservers'][nameserver] = merged_health
+    return merged
@@ -1,16 +1,34 @@
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 from functools import lru_cache
 import re
 from ipaddress import ip_address, ip_network
 from tld import get_tld, get_fld
 from .configs import Target
-from dnslib import DNSRecord
+from socket import inet_ntoa
+from dnslib import DNSRecord, DNSLabel, QTYPE
+from .wire import parse_response, ResourceRecord
 from datetime import datetime
 __all__ = ['create_result_template', 'unpack_packet',
-           'create_error_template', 'make_document_from_response', 'validate_domain']
+           'create_error_template', 'make_document_from_response', 'merge_documents', 'validate_domain',
+           'classify_target', 'TARGET_IPV4', 'TARGET_IPV6', 'TARGET_CIDR', 'TARGET_FQDN', 'TARGET_IDN']
 
 CONST_LRU_CACHE = 100000
 
+# fields of document 'result' for every query type, cname is added for all types
+RESULT_FIELDS = {'A': ['ipv4', 'ip'],
+                 'AAAA': ['ipv6'],
+                 'CNAME': [],
+                 'MX': ['mx'],
+                 'NS': ['ns'],
+                 'TXT': ['txt'],
+                 'SOA': ['soa'],
+                 'SRV': ['srv'],
+                 'CAA': ['caa'],
+                 'PTR': ['ptr']}
+RESULT_FIELDS['ANY'] = [field for fields in RESULT_FIELDS.values() for field in fields]
+# record types (except A and CNAME) and their fields in document 'result'
+RECORD_FIELDS = {28: 'ipv6', 15: 'mx', 2: 'ns', 16: 'txt', 6: 'soa', 33: 'srv', 257: 'caa', 12: 'ptr'}
+
 
 def unpack_packet(payload: bytes) -> str:
     data = DNSRecord.parse(payload)
@@ -51,6 +69,60 @@ def validate_domain(domain: Optional[str]) -> bool:
             return validate_domain_1(domain_value)
 
 
+TARGET_IPV4 = 'ipv4'
+TARGET_IPV6 = 'ipv6'
+TARGET_CIDR = 'cidr'
+TARGET_FQDN = 'fqdn'
+TARGET_IDN = 'idn'
+IPV4_CHARS = frozenset('0123456789.')
+
+
+def is_ipv4_string(value: str) -> bool:
+    """
+    Dotted-quad check without ipaddress objects, leading zeros are rejected like ipaddress does
+    """
+    if not IPV4_CHARS.issuperset(value):
+        return False
+    octets = value.split('.')
+    if len(octets) != 4:
+        return False
+    for octet in octets:
+        if not octet or len(octet) > 3 or (octet[0] == '0' and len(octet) > 1) or int(octet) > 255:
+            return False
+    return True
+
+
+def classify_target(line: str) -> Optional[str]:
+    """
+    Returns kind of input line in one pass: ipv4, ipv6, cidr, fqdn, idn or None for invalid line.
+    Accepts the same lines as is_ip/is_network/validate_domain, but hostnames and IPv4 addresses
+    are checked with string operations, ipaddress is used only for lines with ':' or '/'
+    """
+    if not line:
+        return None
+    if not line.isascii():
+        try:
+            domain = line.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+        return TARGET_IDN if VALID_FQDN_REGEX.match(domain) else None
+    if '/' in line:
+        try:
+            ip_network(line)
+        except ValueError:
+            return None
+        return TARGET_CIDR
+    if ':' in line:
+        try:
+            ip_address(line)
+        except ValueError:
+            return None
+        return TARGET_IPV6
+    if line[-1].isdigit() and is_ipv4_string(line):
+        return TARGET_IPV4
+    return TARGET_FQDN if VALID_FQDN_REGEX.match(line) else None
+
+
 @lru_cache(maxsize=CONST_LRU_CACHE)
 def wrap_get_fld(domain: str) -> Optional[Tuple[str, str, str, str]]:
     try:
@@ -81,19 +153,19 @@ def create_result_template(target: Target) -> Dict:
     Creates result dictionary skeleton
     """
     need_timestamp = int(datetime.now().timestamp())
+    result_fields = {field: [] for field in RESULT_FIELDS[target.qtype]}
+    result_fields['cname'] = []
     result = {'datetime': need_timestamp,
               'hostname': target.hostname,
               'nameserver': target.nameserver,
               'data': {'dns': {'status': 'unknown-error',
-                              'protocol': 'dns',
-                              'type': 'A',
-                              'result': {'ipv4': [],
-                                         'ip': [],
-                                         'cname': [],
-                                         'hostname': target.hostname,
-                                         'nameserver': target.nameserver,
-                                         'datetime': need_timestamp
-                                         }
+                               'protocol': 'dns',
+                               'type': target.qtype,
+                               'result': {**result_fields,
+                                          'hostname': target.hostname,
+                                          'nameserver': target.nameserver,
+                                          'datetime': need_timestamp
+                                          }
                                }
                        }
               }
@@ -114,7 +186,7 @@ def create_error_template(target: Target,
               'nameserver': target.nameserver,
               'data': {'dns': {'status': status,
                                'protocol': 'dns',
-                               'type': 'A',
+                               'type': target.qtype,
                                'error': error_str,
                                'description': description
                                }
@@ -124,33 +196,127 @@ def create_error_template(target: Target,
     return result
 
 
+def label_to_str(label: DNSLabel) -> str:
+    return '.'.join([v.decode('utf-8', 'replace') for v in label.label])
+
+
+def value_to_str(value) -> str:
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else str(value)
+
+
+def fill_result_from_rr(result: Dict, value) -> None:
+    """
+    Adds answer record to 'result' fields of document, records of not requested types are skipped
+    """
+    rtype = value.rtype
+    rdata = value.rdata
+    if rtype == QTYPE.A:
+        if 'ipv4' in result:
+            data = rdata.data
+            if len(data) == 4:
+                ip_int = sum(value * (256 ** (3 - i)) for i, value in enumerate(data))
+                result['ipv4'].append(ip_int)
+                ip_str = '.'.join(str(v) for v in data)
+                result['ip'].append(ip_str)
+    elif rtype == QTYPE.CNAME:
+        result['cname'].append(label_to_str(rdata.label))
+    elif rtype == QTYPE.AAAA:
+        if 'ipv6' in result:
+            result['ipv6'].append(str(rdata))
+    elif rtype == QTYPE.MX:
+        if 'mx' in result:
+            result['mx'].append({'preference': rdata.preference, 'exchange': label_to_str(rdata.label)})
+    elif rtype == QTYPE.NS:
+        if 'ns' in result:
+            result['ns'].append(label_to_str(rdata.label))
+    elif rtype == QTYPE.TXT:
+        if 'txt' in result:
+            result['txt'].append(''.join([value_to_str(v) for v in rdata.data]))
+    elif rtype == QTYPE.SOA:
+        if 'soa' in result:
+            serial, refresh, retry, expire, minimum = rdata.times
+            result['soa'].append({'mname': label_to_str(rdata.mname), 'rname': label_to_str(rdata.rname),
+                                  'serial': serial, 'refresh': refresh, 'retry': retry, 'expire': expire,
+                                  'minimum': minimum})
+    elif rtype == QTYPE.SRV:
+        if 'srv' in result:
+            result['srv'].append({'priority': rdata.priority, 'weight': rdata.weight, 'port': rdata.port,
+                                  'target': label_to_str(rdata.target)})
+    elif rtype == QTYPE.CAA:
+        if 'caa' in result:
+            result['caa'].append({'flags': rdata.flags, 'tag': value_to_str(rdata.tag),
+                                  'value': value_to_str(rdata.value)})
+    elif rtype == QTYPE.PTR:
+        if 'ptr' in result:
+            result['ptr'].append(label_to_str(rdata.label))
+
+
+def fill_result_from_record(result: Dict, record: ResourceRecord) -> None:
+    """
+    Same as fill_result_from_rr for records decoded by wire.parse_response
+    """
+    rtype = record.rtype
+    if rtype == 1:
+        if 'ipv4' in result and len(record.value) == 4:
+            result['ipv4'].append(int.from_bytes(record.value, 'big'))
+            result['ip'].append(inet_ntoa(record.value))
+    elif rtype == 5:
+        result['cname'].append(record.value)
+    else:
+        field = RECORD_FIELDS.get(rtype)
+        if field in result:
+            result[field].append(''.join(record.value) if rtype == 16 else record.value)
+
+
 def make_document_from_response(buffer: bytes, target: Target, addition_dict: Dict = None, protocol: str = '') -> Dict:
-    req_keys = ['ipv4']
-    data_struct = unpack_packet(buffer)
     result = create_result_template(target)
+    values = result['data']['dns']['result']
     try:
-        if data_struct.rr:
-            for value in data_struct.rr:
-
-                if value.rtype == 1:
-                    data = value.rdata.data
-                    if len(data) == 4:
-                        ip_int = sum(value * (256 ** (3 - i)) for i, value in enumerate(data))
-                        result['data']['dns']['result']['ipv4'].append(ip_int)
-                        ip_str = '.'.join(str(v) for v in data)
-                        result['data']['dns']['result']['ip'].append(ip_str)
-                elif value.rtype == 5:
-                    data = value.rdata.label
-                    data = '.'.join([v.decode() for v in data.label])
-                    result['data']['dns']['result']['cname'].append(data)
+        response = parse_response(buffer)
+    except Exception:
+        # malformed or unusual packet, dnslib decides
+        response = None
+    try:
+        if response:
+            if not response.answers:
+                return create_error_template(target, '', status='not found')
+            for record in response.answers:
+                fill_result_from_record(values, record)
         else:
-            return create_error_template(target, '', status='not found')
+            data_struct = unpack_packet(buffer)
+            if not data_struct.rr:
+                return create_error_template(target, '', status='not found')
+            for value in data_struct.rr:
+                fill_result_from_rr(values, value)
     except Exception as e:
         return create_error_template(target,  type(e).__name__, type(e).__name__)
-    if result['data']['dns']['result']['ipv4']:
+    fields = RESULT_FIELDS[target.qtype] or ['cname']
+    if any(values[field] for field in fields):
         result['data']['dns']['status'] = 'success'
-        if not result['data']['dns']['result']['cname']:
-            result['data']['dns']['result'].pop('cname')
+        for field in list(values):
+            if isinstance(values[field], list) and not values[field]:
+                values.pop(field)
     else:
         return create_error_template(target, '')
     return result
+
+
+def merge_documents(targets: Sequence[Target], documents: Sequence[Dict]) -> Dict:
+    """
+    Merges documents of several query types for one hostname into one document,
+    'data.dns.result' holds 'data.dns' of every query type
+    """
+    statuses = [document['data']['dns']['status'] for document in documents]
+    status = 'success' if 'success' in statuses else statuses[0]
+    result = {'datetime': int(datetime.now().timestamp()),
+              'hostname': targets[0].hostname,
+              'nameserver': targets[0].nameserver,
+              'data': {'dns': {'status': status,
+                               'protocol': 'dns',
+                               'type': [target.qtype for target in targets],
+                               'result': {target.qtype: document['data']['dns']
+                                          for target, document in zip(targets, documents)}
+                               }
+                       }
+              }
+    return result
@@ -0,0 +1,237 @@
+from collections import namedtuple
+from socket import inet_ntop, AF_INET6
+from struct import Struct
+from typing import List, Optional, Tuple
+
+__all__ = ['QTYPE_CODES', 'QTYPE_NAMES', 'DnsResponse', 'ResourceRecord', 'encode_name', 'pack_question',
+           'parse_response', 'response_ttl', 'strip_edns', 'response_edns_bufsize']
+
+QTYPE_CODES = {'A': 1, 'NS': 2, 'CNAME': 5, 'SOA': 6, 'PTR': 12, 'MX': 15, 'TXT': 16, 'AAAA': 28, 'SRV': 33,
+               'OPT': 41, 'ANY': 255, 'CAA': 257}
+QTYPE_NAMES = {code: name for name, code in QTYPE_CODES.items()}
+
+HEADER = Struct('!HHHHHH')
+RR_FIXED = Struct('!HHIH')
+SOA_TIMES = Struct('!IIIII')
+SRV_FIXED = Struct('!HHH')
+
+FLAG_RD = 0x0100
+FLAG_TC = 0x0200
+CLASS_IN = 1
+MAX_POINTERS = 64
+
+OPT_SIZE = 11
+
+# header with ID 0, RD flag and one question, ID is set by socket pool
+QUESTION_HEADER = HEADER.pack(0, FLAG_RD, 1, 0, 0, 0)
+# same with OPT record in additional section
+QUESTION_HEADER_EDNS = HEADER.pack(0, FLAG_RD, 1, 0, 0, 1)
+QUESTION_SUFFIXES = {name: code.to_bytes(2, 'big') + CLASS_IN.to_bytes(2, 'big') for name, code in QTYPE_CODES.items()}
+
+DnsResponse = namedtuple('DnsResponse', ['id', 'flags', 'rcode', 'truncated', 'answers', 'authority', 'additional'])
+ResourceRecord = namedtuple('ResourceRecord', ['rtype', 'rclass', 'ttl', 'value'])
+
+
+def encode_name(hostname: str) -> bytes:
+    """
+    Encodes hostname to QNAME wire format, IDN hostnames are encoded with IDNA
+    """
+    try:
+        name = hostname.encode('ascii')
+    except UnicodeEncodeError:
+        name = hostname.encode('idna')
+    result = bytearray()
+    for label in name.strip(b'.').split(b'.'):
+        if not label or len(label) > 63:
+            raise ValueError(f'invalid label in hostname: {hostname}')
+        result.append(len(label))
+        result += label
+    result.append(0)
+    return bytes(result)
+
+
+def pack_opt(edns_bufsize: int) -> bytes:
+    """
+    EDNS0 OPT pseudo-record: root name, type OPT, class - UDP payload size, no flags and options
+    """
+    return b'\x00' + RR_FIXED.pack(QTYPE_CODES['OPT'], edns_bufsize, 0, 0)
+
+
+def pack_question(hostname: str, qtype: str = 'A', edns_bufsize: int = 0) -> bytes:
+    """
+    Packs DNS query with one question, transaction ID is 0.
+    With edns_bufsize OPT record advertises UDP payload size to nameserver
+    """
+    if edns_bufsize:
+        return QUESTION_HEADER_EDNS + encode_name(hostname) + QUESTION_SUFFIXES[qtype] + pack_opt(edns_bufsize)
+    return QUESTION_HEADER + encode_name(hostname) + QUESTION_SUFFIXES[qtype]
+
+
+def strip_edns(packet: bytes) -> bytes:
+    """
+    Removes OPT record packed by pack_question, for nameservers without EDNS support
+    """
+    if packet[10:12] == b'\x00\x01' and packet[-OPT_SIZE:-OPT_SIZE + 3] == b'\x00\x00\x29':
+        return packet[:10] + b'\x00\x00' + packet[12:-OPT_SIZE]
+    return packet
+
+
+def read_name(view: memoryview, offset: int) -> Tuple[str, int]:
+    """
+    Reads (possibly compressed) domain name, returns name and offset after it
+    """
+    labels = []
+    end = 0
+    pointers = 0
+    while True:
+        length = view[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length >= 0xc0:
+            if not end:
+                end = offset + 2
+            pointers += 1
+            if pointers > MAX_POINTERS:
+                raise ValueError('compression loop')
+            offset = ((length & 0x3f) << 8) | view[offset + 1]
+            continue
+        offset += 1
+        labels.append(str(view[offset:offset + length], 'utf-8', 'replace'))
+        offset += length
+    return '.'.join(labels), end or offset
+
+
+def skip_name(view: memoryview, offset: int) -> int:
+    """
+    Returns offset after domain name without decoding it
+    """
+    while True:
+        length = view[offset]
+        if length == 0:
+            return offset + 1
+        if length >= 0xc0:
+            return offset + 2
+        offset += length + 1
+
+
+def read_strings(view: memoryview, offset: int, end: int) -> List[str]:
+    strings = []
+    while offset < end:
+        length = view[offset]
+        offset += 1
+        strings.append(str(view[offset:offset + length], 'utf-8', 'replace'))
+        offset += length
+    return strings
+
+
+def decode_rdata(view: memoryview, rtype: int, offset: int, length: int):
+    """
+    Decodes RDATA of known record types, returns raw bytes for other types
+    """
+    if rtype == 1:
+        return bytes(view[offset:offset + length])
+    if rtype in (2, 5, 12):
+        return read_name(view, offset)[0]
+    if rtype == 28:
+        return inet_ntop(AF_INET6, view[offset:offset + length])
+    if rtype == 15:
+        return {'preference': int.from_bytes(view[offset:offset + 2], 'big'),
+                'exchange': read_name(view, offset + 2)[0]}
+    if rtype == 16:
+        return read_strings(view, offset, offset + length)
+    if rtype == 6:
+        mname, position = read_name(view, offset)
+        rname, position = read_name(view, position)
+        serial, refresh, retry, expire, minimum = SOA_TIMES.unpack_from(view, position)
+        return {'mname': mname, 'rname': rname, 'serial': serial, 'refresh': refresh, 'retry': retry,
+                'expire': expire, 'minimum': minimum}
+    if rtype == 33:
+        priority, weight, port = SRV_FIXED.unpack_from(view, offset)
+        return {'priority': priority, 'weight': weight, 'port': port, 'target': read_name(view, offset + 6)[0]}
+    if rtype == 257:
+        tag_length = view[offset + 1]
+        tag_end = offset + 2 + tag_length
+        return {'flags': view[offset], 'tag': str(view[offset + 2:tag_end], 'utf-8', 'replace'),
+                'value': str(view[tag_end:offset + length], 'utf-8', 'replace')}
+    return bytes(view[offset:offset + length])
+
+
+def read_records(view: memoryview, offset: int, count: int, records: List[ResourceRecord]) -> int:
+    for _ in range(count):
+        offset = skip_name(view, offset)
+        rtype, rclass, ttl, length = RR_FIXED.unpack_from(view, offset)
+        offset += 10
+        if offset + length > len(view):
+            raise ValueError('truncated record')
+        records.append(ResourceRecord(rtype, rclass, ttl, decode_rdata(view, rtype, offset, length)))
+        offset += length
+    return offset
+
+
+def parse_response(buffer: bytes) -> DnsResponse:
+    """
+    Parses DNS response: header and records of all sections, question section is skipped
+    """
+    view = memoryview(buffer)
+    transaction_id, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(view, 0)
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_name(view, offset) + 4
+    answers, authority, additional = [], [], []
+    offset = read_records(view, offset, ancount, answers)
+    offset = read_records(view, offset, nscount, authority)
+    read_records(view, offset, arcount, additional)
+    return DnsResponse(transaction_id, flags, flags & 0xf, bool(flags & FLAG_TC), answers, authority, additional)
+
+
+def response_ttl(buffer: bytes) -> Optional[int]:
+    """
+    Returns time to cache response: min TTL of answers or, for negative response, TTL of SOA from
+    authority section limited by SOA minimum. None - response should not be cached
+    """
+    view = memoryview(buffer)
+    _, flags, qdcount, ancount, nscount, _ = HEADER.unpack_from(view, 0)
+    rcode = flags & 0xf
+    if flags & FLAG_TC or rcode not in (0, 3):
+        return None
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_name(view, offset) + 4
+    ttl = None
+    for _ in range(ancount):
+        offset = skip_name(view, offset)
+        rtype, _, record_ttl, length = RR_FIXED.unpack_from(view, offset)
+        offset += 10 + length
+        ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+    if ancount:
+        return ttl
+    for _ in range(nscount):
+        offset = skip_name(view, offset)
+        rtype, _, record_ttl, length = RR_FIXED.unpack_from(view, offset)
+        offset += 10
+        if rtype == 6:
+            return min(record_ttl, decode_rdata(view, rtype, offset, length)['minimum'])
+        offset += length
+    return None
+
+
+def response_edns_bufsize(buffer: bytes) -> Optional[int]:
+    """
+    Returns UDP payload size advertised by nameserver in OPT record, None if response has no OPT record
+    """
+    view = memoryview(buffer)
+    _, _, qdcount, ancount, nscount, arcount = HEADER.unpack_from(view, 0)
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_name(view, offset) + 4
+    for _ in range(ancount + nscount):
+        offset = skip_name(view, offset)
+        offset += 10 + RR_FIXED.unpack_from(view, offset)[3]
+    for _ in range(arcount):
+        offset = skip_name(view, offset)
+        rtype, rclass, _, length = RR_FIXED.unpack_from(view, offset)
+        if rtype == QTYPE_CODES['OPT']:
+            return rclass
+        offset += 10 + length
+    return None
@@ -1,11 +1,16 @@
 import asyncio
+import zlib
 from base64 import b64decode
-from typing import Any, Tuple
+from binascii import a2b_base64
+from string import whitespace
+from typing import Any, Iterator, Tuple
 
 from lib.core import create_error_template, Target
 
-__all__ = ['single_read', 'multi_read', 'write_to_stdout', 'write_to_file', 'decode_base64_string',
-           'filter_bytes']
+__all__ = ['single_read', 'multi_read', 'decode_base64_string', 'filter_bytes', 'iter_base64_zlib_lines']
+
+CHUNK_SIZE = 64 * 1024
+DELETE_WHITESPACE = str.maketrans('', '', whitespace)
 
 
 async def single_read(reader: asyncio.StreamReader,
@@ -53,20 +58,6 @@ async def multi_read(reader: asyncio.StreamReader, target: Target) -> Tuple[bool
         return False, create_error_template(target, str(e))
 
 
-async def write_to_stdout(io, record: str):
-    """
-    Write in 'wb' mode to io, input string in utf-8
-    """
-    return await io.write(record.encode('utf-8') + b'\n')
-
-
-async def write_to_file(io, record: str):
-    """
-    Write in 'text' mode to io
-    """
-    return await io.write(record + '\n')
-
-
 # noinspection PyBroadException
 def decode_base64_string(string: str, encoding='utf-8') -> bytes:
     """
@@ -84,3 +75,29 @@ def filter_bytes(buffer: bytes, target: Target) -> bool:
     Returns True if there are not search_values
     """
     return not target.search_values or any(x in buffer for x in target.search_values)
+
+
+def iter_base64_zlib_lines(payload: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Decodes base64 string with zlib compressed text chunk by chunk and yields its lines,
+    whole decompressed text is never kept in memory.
+    Raises ValueError (binascii.Error) or zlib.error on broken or truncated payload
+    """
+    decompressor = zlib.decompressobj()
+    encoded_tail = ''
+    tail = b''
+    for position in range(0, len(payload), chunk_size):
+        encoded = encoded_tail + payload[position:position + chunk_size].translate(DELETE_WHITESPACE)
+        size = len(encoded) - len(encoded) % 4
+        encoded_tail = encoded[size:]
+        lines = (tail + decompressor.decompress(a2b_base64(encoded[:size]))).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', 'replace')
+    if encoded_tail:
+        raise ValueError('incomplete base64 payload')
+    tail += decompressor.flush()
+    if not decompressor.eof:
+        raise zlib.error('incomplete or truncated zlib stream')
+    for line in tail.split(b'\n'):
+        yield line.decode('utf-8', 'replace')
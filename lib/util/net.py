@@ -1,6 +1,7 @@
 from ipaddress import ip_network, ip_address
+from typing import Iterator
 
-__all__ = ['is_ip', 'is_network']
+__all__ = ['is_ip', 'is_network', 'iter_network_hosts']
 
 
 def is_ip(ip_str: str) -> bool:
@@ -23,3 +24,11 @@ def is_network(net_str: str) -> bool:
         return True
     except ValueError:
         return False
+
+
+def iter_network_hosts(net_str: str) -> Iterator[str]:
+    """
+    Yields host addresses of network one by one, network is never expanded in memory
+    """
+    for address in ip_network(net_str, strict=False).hosts():
+        yield str(address)
@@ -1,14 +1,22 @@
 import argparse
+from importlib.util import find_spec
 from os import path
 from sys import stderr
-from typing import Tuple
-from lib.core import AppConfig, TargetConfig
+from typing import Any, Callable, Dict, Tuple, List
+from lib.core import AppConfig, TargetConfig, NameserverScheduler
 from .net import is_ip
-from itertools import cycle
 
-__all__ = ['parse_args', 'parse_settings', 'QUERY_TYPES_ARE_SUPPORTED', 'abort']
+__all__ = ['parse_args', 'parse_settings', 'parse_query_types', 'parse_nameserver_limits', 'QUERY_TYPES_ARE_SUPPORTED',
+           'OUTPUT_FORMATS', 'COLUMNAR_FORMATS', 'STREAM_FORMATS', 'COMPRESSIONS', 'SHARD_MODES', 'TRANSPORTS',
+           'abort']
 
-QUERY_TYPES_ARE_SUPPORTED = ['A', 'ANY', 'CAA', 'CNAME', 'MX',  'NS', 'SOA', 'SRV', 'TXT']
+OUTPUT_FORMATS = ['json', 'msgpack', 'msgpack-stream', 'arrow', 'parquet']
+COLUMNAR_FORMATS = ['arrow', 'parquet']
+STREAM_FORMATS = ['json', 'msgpack', 'msgpack-stream']  # outputs of several workers can be concatenated
+SHARD_MODES = ['hash', 'chunk']
+TRANSPORTS = ['udp', 'tcp']
+COMPRESSIONS = ['gzip', 'zstd']
+QUERY_TYPES_ARE_SUPPORTED = ['A', 'AAAA', 'ANY', 'CAA', 'CNAME', 'MX',  'NS', 'PTR', 'SOA', 'SRV', 'TXT']
 
 
 def parse_args():
@@ -18,7 +26,8 @@ def parse_args():
     parser.add_argument('-t', '--targets', nargs='+', type=str, default='', dest='single_targets',
                         help='Single targets: ipv4, hostname, CIDRs')
     parser.add_argument('-q', '--query', type=str, default='A', dest='query',
-                        help='single query: A, NS, TXT, MX ..., default: A')
+                        help='query types as string with "," as split symbol: A, AAAA, NS, TXT, MX ..., '
+                             'default: A. IP addresses and networks are always resolved with PTR queries')
     parser.add_argument('-r', '--nameservers', type=str, default='8.8.8.8,8.8.4.4,77.88.8.8,77.88.8.1,1.0.0.1,1.1.1.1', dest='nameservers',
                         help='nameservers as string with "," as split symbol, '
                              'default: 8.8.8.8,8.8.4.4,77.88.8.8,77.88.8.1,1.0.0.1,1.1.1.1')
@@ -26,13 +35,68 @@ def parse_args():
     parser.add_argument('-o', '--output-file', dest='output_file', type=str, help='path to file with results')
     parser.add_argument('-s', '--senders', dest='senders', type=int, default=1024,
                         help='Number of send coroutines to use (default: 1024)')
-    parser.add_argument('--queue-sleep', dest='queue_sleep', type=int, default=1,
-                        help='Sleep duration if the queue is full, default 1 sec. Queue size == senders')
-    parser.add_argument('-timeout', '--timeout', dest='timeout', type=int, default=2,
-                        help='Set timeout, seconds (default: 2)')
+    parser.add_argument('--sockets-per-nameserver', dest='sockets_per_nameserver', type=int, default=4,
+                        help='Number of long-lived UDP sockets and TCP connections per nameserver (default: 4)')
+    parser.add_argument('--transport', dest='transport', type=str, default='udp', choices=TRANSPORTS,
+                        help='udp - queries over UDP, truncated responses are repeated over TCP, '
+                             'tcp - all queries over persistent pipelined TCP connections (default: udp)')
+    parser.add_argument('--edns-bufsize', dest='edns_bufsize', type=int, default=1232,
+                        help='UDP payload size advertised in EDNS0 OPT record of queries, '
+                             '0 - queries without EDNS0 (default: 1232)')
+    parser.add_argument('--queue-size', dest='queue_size', type=int, default=0,
+                        help='Max size of the input queue, default: equal to senders')
+    parser.add_argument('-timeout', '--timeout', dest='timeout', type=float, default=2,
+                        help='Set timeout of one attempt, seconds (default: 2)')
+    parser.add_argument('--retries', dest='retries', type=int, default=1,
+                        help='Number of retries after timeout, every retry uses the next nameserver (default: 1)')
+    parser.add_argument('--retry-backoff', dest='retry_backoff', type=float, default=0.1,
+                        help='Base of exponential backoff with jitter between retries, seconds (default: 0.1)')
+    parser.add_argument('--qps', dest='qps', type=float, default=0,
+                        help='Max queries per second to every nameserver, 0 - no limit (default: 0)')
+    parser.add_argument('--qps-per-nameserver', dest='qps_per_nameserver', type=str, default='',
+                        help='Max queries per second for single nameservers, example: 8.8.8.8=500,1.1.1.1=1000')
+    parser.add_argument('--max-inflight', dest='max_inflight', type=int, default=0,
+                        help='Max queries in flight to every nameserver, 0 - no limit (default: 0)')
+    parser.add_argument('--max-inflight-per-nameserver', dest='max_inflight_per_nameserver', type=str, default='',
+                        help='Max queries in flight for single nameservers, example: 8.8.8.8=100,1.1.1.1=200')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=0,
+                        help='Max number of cached responses, repeated hostnames are answered from cache '
+                             'until TTL expires, 0 - no cache (default: 0)')
+    parser.add_argument('--cache-file', dest='cache_file', type=str, default=None,
+                        help='Path to sqlite file, cache is loaded from it on start and saved to it at the end')
+    parser.add_argument('--output-batch', dest='output_batch', type=int, default=5000,
+                        help='Results are encoded and written by batches of this size (default: 5000)')
+    parser.add_argument('--flush-interval', dest='flush_interval', type=float, default=1.0,
+                        help='Max time results wait in buffer, seconds (default: 1)')
     parser.add_argument('--show-statistics', dest='statistics', action='store_true')
-    parser.add_argument('--use-msgpack', dest='use_msgpack', action='store_true')
+    parser.add_argument('--output-format', dest='output_format', type=str, default='json',
+                        choices=OUTPUT_FORMATS,
+                        help='json - json lines, msgpack - base64 encoded msgpack lines, '
+                             'msgpack-stream - msgpack documents prefixed by 4 bytes length, '
+                             'arrow - Arrow IPC stream, parquet - Parquet file (default: json)')
+    parser.add_argument('--compress', dest='compress', type=str, default=None, choices=COMPRESSIONS,
+                        help='Compress output on the fly')
+    parser.add_argument('--compress-level', dest='compress_level', type=int, default=None,
+                        help='Compression level (default: 6 for gzip, 3 for zstd)')
+    parser.add_argument('--use-msgpack', dest='use_msgpack', action='store_true', help='Same as --output-format msgpack')
+    parser.add_argument('--split-queries', dest='split_queries', action='store_true',
+                        help='With several query types write one document per query type, '
+                             'default: one merged document per hostname')
     parser.add_argument('--show-only-success', dest='show_only_success', action='store_true')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+                        help='Number of worker processes, every worker runs own event loop with --senders coroutines, '
+                             'input is sharded between them (default: 1)')
+    parser.add_argument('--shard-by', dest='shard_by', type=str, default='hash', choices=SHARD_MODES,
+                        help='hash - by hash of hostname, repeated hostnames go to one worker, '
+                             'chunk - round-robin chunks of lines (default: hash)')
+    parser.add_argument('--checkpoint-file', dest='checkpoint_file', type=str, default=None,
+                        help='Save offset of input file, up to which all targets are resolved and written, '
+                             'to this file (default with --resume: output file + ".checkpoint")')
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=float, default=10.0,
+                        help='Interval of saving checkpoint, seconds (default: 10)')
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help='Continue reading input file from offset of checkpoint file and append to output file, '
+                             'results written after last checkpoint may be repeated')
     return parser.parse_args()
 
 
@@ -58,7 +122,29 @@ def parse_settings(args: argparse.Namespace) -> Tuple[TargetConfig, AppConfig]:
     if not args.output_file:
         output_file, write_mode = '/dev/stdout', 'wb'
     else:
-        output_file, write_mode = args.output_file, 'a'
+        output_file, write_mode = args.output_file, 'ab'
+
+    output_format = 'msgpack' if args.use_msgpack else args.output_format
+    if output_format in COLUMNAR_FORMATS:
+        if not find_spec('pyarrow'):
+            abort(f'ERROR: pyarrow is required for output format: {output_format}')
+        # Arrow stream or Parquet file can not be appended to existing one, output file is overwritten
+        write_mode = 'wb'
+    if args.compress == 'zstd' and not find_spec('zstandard'):
+        abort('ERROR: zstandard is required for zstd compression')
+    if args.workers > 1 and output_format not in STREAM_FORMATS:
+        abort(f'ERROR: output format is not supported with several workers: {output_format}')
+    checkpoint_file = args.checkpoint_file
+    if args.resume and not checkpoint_file and args.output_file:
+        checkpoint_file = f'{args.output_file}.checkpoint'
+    if checkpoint_file or args.resume:
+        if not input_file or not args.output_file:
+            abort('ERROR: checkpoints require input file(-f) and output file(-o)')
+        if args.compress or output_format not in STREAM_FORMATS or args.workers > 1:
+            abort('ERROR: checkpoints are not supported with compression, columnar formats or several workers')
+
+    if args.edns_bufsize and not 512 <= args.edns_bufsize <= 65535:
+        abort(f'ERROR: EDNS buffer size must be 0 or from 512 to 65535: {args.edns_bufsize}')
 
     # endregion
     nameservers = []
@@ -72,15 +158,18 @@ def parse_settings(args: argparse.Namespace) -> Tuple[TargetConfig, AppConfig]:
     if not nameservers:
         abort(f'ERROR: not set nameservers: {args.nameservers}')
 
-    query_types_are_supported = []
-    if args.query:
-        if args.query in QUERY_TYPES_ARE_SUPPORTED:
-            query_types_are_supported = [args.query]
+    try:
+        qps_per_nameserver = parse_nameserver_limits(args.qps_per_nameserver, float)
+        max_inflight_per_nameserver = parse_nameserver_limits(args.max_inflight_per_nameserver, int)
+    except ValueError as exp:
+        abort('ERROR: wrong limits of nameservers', exp)
+
+    query_types_are_supported = parse_query_types(args.query)
     if not query_types_are_supported:
         abort(f'ERROR: query type not supported: {args.query}')
     app_settings = AppConfig(**{
         'senders': args.senders,
-        'queue_sleep': args.queue_sleep,
+        'queue_size': args.queue_size or args.senders,
         'statistics': args.statistics,
         'input_file': input_file,
         'input_stdin': args.input_stdin,
@@ -90,17 +179,70 @@ def parse_settings(args: argparse.Namespace) -> Tuple[TargetConfig, AppConfig]:
         'show_only_success': args.show_only_success,
         'nameservers': nameservers,
         'query_types_are_supported': query_types_are_supported,
+        'split_queries': args.split_queries,
         'timeout': args.timeout,
-        'use_msgpack': args.use_msgpack
+        'retries': args.retries,
+        'retry_backoff': args.retry_backoff,
+        'qps': args.qps,
+        'qps_per_nameserver': qps_per_nameserver,
+        'max_inflight': args.max_inflight,
+        'max_inflight_per_nameserver': max_inflight_per_nameserver,
+        'cache_size': args.cache_size,
+        'cache_file': args.cache_file,
+        'output_batch': args.output_batch,
+        'flush_interval': args.flush_interval,
+        'output_format': output_format,
+        'compress': args.compress,
+        'compress_level': args.compress_level,
+        'sockets_per_nameserver': args.sockets_per_nameserver,
+        'workers': max(1, args.workers),
+        'shard_by': args.shard_by,
+        'checkpoint_file': checkpoint_file,
+        'checkpoint_interval': args.checkpoint_interval,
+        'resume': args.resume,
+        'transport': args.transport,
+        'edns_bufsize': args.edns_bufsize
     })
 
     target_settings = TargetConfig(**{
-        'nameservers': cycle(nameservers)
+        'nameservers': NameserverScheduler(nameservers),
+        'query_types': query_types_are_supported,
+        'edns_bufsize': args.edns_bufsize
     })
 
     return target_settings, app_settings
 
 
+def parse_query_types(value: str) -> List[str]:
+    """
+    Parses query types separated by ",", returns empty list if any of them is not supported
+    """
+    query_types = []
+    if value:
+        for query_type in value.split(','):
+            query_type = query_type.strip().upper()
+            if query_type not in QUERY_TYPES_ARE_SUPPORTED:
+                return []
+            if query_type not in query_types:
+                query_types.append(query_type)
+    return query_types
+
+
+def parse_nameserver_limits(value: str, cast: Callable[[str], Any]) -> Dict[str, Any]:
+    """
+    Parses limits of nameservers: "8.8.8.8=500,1.1.1.1=1000"
+    """
+    limits = {}
+    if value:
+        for record in value.split(','):
+            if record.strip():
+                nameserver, limit = record.split('=', 1)
+                if not is_ip(nameserver.strip()):
+                    raise ValueError(f'not ip address: {nameserver}')
+                limits[nameserver.strip()] = cast(limit.strip())
+    return limits
+
+
 def abort(message: str, exc: Exception = None, exit_code: int = 1):
     print(message, file=stderr)
     if exc:
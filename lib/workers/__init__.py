@@ -1,2 +1,8 @@
 from .tasks import *
 from .factories import *
+from .pool import *
+from .limits import *
+from .writers import *
+from .pipeline import *
+from .shards import *
+from .checkpoint import *
@@ -0,0 +1,61 @@
+from collections import deque, namedtuple
+from os import path, replace
+from time import monotonic
+from typing import Dict, Iterable
+
+__all__ = ['Checkpoint', 'Marked']
+
+# item of queues with position of input line: targets of the line for input queue, () for results queue
+Marked = namedtuple('Marked', ['targets', 'offset'])
+
+
+class Checkpoint:
+    """
+    Low watermark of input file: byte offset up to which every line is resolved and its results are written.
+    Lines complete out of order, so offset moves only when all lines before it are done.
+    Offset is saved to file every interval seconds, with resume reading continues from it
+    """
+
+    def __init__(self, file_path: str, resume: bool = False, interval: float = 10.0):
+        self.file_path = file_path
+        self.interval = interval
+        self.offset = self.load() if resume else 0
+        self.pending = deque()  # end offsets of lines in order of reading
+        self.remaining: Dict[int, int] = {}  # end offset of line: number of its not completed parts
+        self.saved = monotonic()
+
+    def load(self) -> int:
+        if not path.isfile(self.file_path):
+            return 0
+        with open(self.file_path, 'rt') as f:
+            return int(f.read().strip() or 0)
+
+    def read(self, offset: int):
+        """
+        Registers line of input ending at offset, line is one part until producer adds more
+        """
+        self.pending.append(offset)
+        self.remaining[offset] = 1
+
+    def add(self, offset: int):
+        """
+        Adds one more part to line, e.g. one address of expanded network
+        """
+        self.remaining[offset] += 1
+
+    def complete(self, offsets: Iterable[int]):
+        for offset in offsets:
+            self.remaining[offset] -= 1
+        while self.pending and not self.remaining[self.pending[0]]:
+            self.offset = self.pending.popleft()
+            del self.remaining[self.offset]
+
+    def due(self) -> bool:
+        return monotonic() - self.saved >= self.interval
+
+    def save(self):
+        tmp_path = f'{self.file_path}.tmp'
+        with open(tmp_path, 'wt') as f:
+            f.write(f'{self.offset}\n')
+        replace(tmp_path, self.file_path)
+        self.saved = monotonic()
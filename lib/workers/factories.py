@@ -1,12 +1,19 @@
+from ipaddress import ip_address
 from typing import Iterator, Generator, Optional, List
 from lib.core import Target, TargetConfig
-from dnslib import DNSRecord
+from lib.core import pack_question
+from dnslib import DNSRecord, EDNS0
 
 # noinspection PyArgumentList
 
-def pack_packet_a(hostname: str) -> bytes:
-    payload = DNSRecord.question(hostname)
-    return bytes(payload.pack())
+def pack_packet(hostname: str, qtype: str = 'A', edns_bufsize: int = 0) -> bytes:
+    try:
+        return pack_question(hostname, qtype, edns_bufsize)
+    except ValueError:
+        payload = DNSRecord.question(hostname, qtype)
+        if edns_bufsize:
+            payload.add_ar(EDNS0(udp_len=edns_bufsize))
+        return bytes(payload.pack())
 
 
 def create_target_dns_protocol(hostname: str, target_config: TargetConfig) -> Iterator[Target]:
@@ -14,9 +21,10 @@ def create_target_dns_protocol(hostname: str, target_config: TargetConfig) -> It
     На основании ip адреса и настроек возвращает через yield экземпляр Target.
     Каждый экземпляр Target содержит всю необходимую информацию(настройки и параметры) для функции worker.
     """
-    kwargs = target_config.as_dict()
-    kwargs['payload'] = pack_packet_a(hostname)
-    yield Target(hostname=hostname, **kwargs)
+    for qtype in target_config.query_types:
+        kwargs = target_config.as_dict()
+        kwargs['payload'] = pack_packet(hostname, qtype, target_config.edns_bufsize)
+        yield Target(hostname=hostname, qtype=qtype, **kwargs)
 
 
 
@@ -24,4 +32,13 @@ def create_targets_dns_protocol(hosts: List[str], settings: TargetConfig) -> Gen
     for _host in hosts:
         host = _host.lower().strip()
         for target in create_target_dns_protocol(host, settings):
-            yield target
\ No newline at end of file
+            yield target
+
+
+def create_ptr_target(address: str, target_config: TargetConfig) -> Target:
+    """
+    PTR query of in-addr.arpa/ip6.arpa name of IP address, hostname of Target is the address itself
+    """
+    kwargs = target_config.as_dict()
+    kwargs['payload'] = pack_packet(ip_address(address).reverse_pointer, 'PTR', target_config.edns_bufsize)
+    return Target(hostname=address, qtype='PTR', **kwargs)
@@ -0,0 +1,92 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+__all__ = ['TokenBucket', 'NameserverLimits']
+
+
+class TokenBucket:
+    """
+    Token bucket, rate - tokens per second, burst - bucket size.
+    Tokens are reserved in advance, so waiters wake up one by one at their own time
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate / 10)
+        self.tokens = self.burst
+        self.updated = 0.0
+
+    def available(self) -> bool:
+        """
+        Returns True if token can be taken without waiting
+        """
+        tokens = self.tokens
+        if self.updated:
+            tokens = min(self.burst, tokens + (asyncio.get_running_loop().time() - self.updated) * self.rate)
+        return tokens >= 1
+
+    async def acquire(self):
+        now = asyncio.get_running_loop().time()
+        if self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class NameserverLimits:
+    """
+    QPS limits(token buckets) and limits of queries in flight for every nameserver,
+    0 - no limit
+    """
+
+    def __init__(self, qps: float = 0, max_inflight: int = 0,
+                 qps_per_nameserver: Optional[Dict[str, float]] = None,
+                 max_inflight_per_nameserver: Optional[Dict[str, int]] = None):
+        self.qps = qps
+        self.max_inflight = max_inflight
+        self.qps_per_nameserver = qps_per_nameserver or {}
+        self.max_inflight_per_nameserver = max_inflight_per_nameserver or {}
+        self.limits: Dict[str, Tuple[Optional[TokenBucket], Optional[asyncio.Semaphore]]] = {}
+
+    def __bool__(self):
+        return bool(self.qps or self.max_inflight or self.qps_per_nameserver or self.max_inflight_per_nameserver)
+
+    def get(self, nameserver: str) -> Tuple[Optional[TokenBucket], Optional[asyncio.Semaphore]]:
+        limits = self.limits.get(nameserver)
+        if limits is None:
+            qps = self.qps_per_nameserver.get(nameserver, self.qps)
+            max_inflight = self.max_inflight_per_nameserver.get(nameserver, self.max_inflight)
+            limits = self.limits[nameserver] = (TokenBucket(qps) if qps > 0 else None,
+                                                asyncio.Semaphore(max_inflight) if max_inflight > 0 else None)
+        return limits
+
+    def available(self, nameserver: str) -> bool:
+        """
+        Returns True if query to nameserver can be sent without waiting for its limits
+        """
+        bucket, semaphore = self.get(nameserver)
+        if semaphore and semaphore.locked():
+            return False
+        return bucket is None or bucket.available()
+
+    async def acquire(self, nameserver: str):
+        """
+        Waits for free slot of in-flight limit, then for token
+        """
+        bucket, semaphore = self.get(nameserver)
+        if semaphore:
+            await semaphore.acquire()
+        if bucket:
+            try:
+                await bucket.acquire()
+            except BaseException:
+                if semaphore:
+                    semaphore.release()
+                raise
+
+    def release(self, nameserver: str):
+        _, semaphore = self.get(nameserver)
+        if semaphore:
+            semaphore.release()
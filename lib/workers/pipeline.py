@@ -0,0 +1,73 @@
+import asyncio
+from typing import Callable, Optional
+
+from lib.core import AppConfig, TargetConfig, Stats, AnswerCache
+from .tasks import TargetReader, Executor, OutputPrinter, TargetWorker, create_io_reader, run_workers
+from .pool import DnsSocketPool
+from .limits import NameserverLimits
+from .writers import create_encoder, create_compressor
+from .checkpoint import Checkpoint
+
+__all__ = ['Resolver', 'run_pipeline']
+
+
+class Resolver:
+    """
+    Components shared by all pipelines of process: senders semaphore, UDP sockets and TCP connections,
+    answer cache and limits of nameservers
+    """
+
+    def __init__(self, config: AppConfig):
+        self.semaphore = asyncio.Semaphore(config.senders)
+        self.socket_pool = DnsSocketPool(config.sockets_per_nameserver, config.transport)
+        self.tcp_pool = DnsSocketPool(config.sockets_per_nameserver, 'tcp') if config.transport == 'udp' else None
+        self.cache = AnswerCache(config.cache_size, config.cache_file) if config.cache_size > 0 else None
+        self.limits = NameserverLimits(config.qps, config.max_inflight,
+                                       config.qps_per_nameserver, config.max_inflight_per_nameserver)
+
+    def close(self):
+        self.socket_pool.close()
+        if self.tcp_pool:
+            self.tcp_pool.close()
+        if self.cache:
+            self.cache.save()
+
+
+async def run_pipeline(target_settings: TargetConfig, config: AppConfig, resolver: Resolver,
+                       statistics: Optional[Stats], io,
+                       reader: Optional[Callable[[asyncio.Queue], TargetReader]] = None,
+                       checkpoint: Optional[Checkpoint] = None,
+                       compress: bool = True, print_statistics: bool = True):
+    """
+    Resolves targets of reader (by default the input of config) and writes results to io.
+    reader - creates reader of targets for input queue, compress - output is compressed as set in config,
+    print_statistics - statistics are written after results
+    """
+    queue_input = asyncio.Queue(maxsize=config.queue_size)
+    queue_prints = asyncio.Queue(maxsize=config.senders * 2)
+
+    target_worker = TargetWorker(statistics,
+                                 resolver.semaphore,
+                                 queue_prints,
+                                 config.show_only_success,
+                                 pool=resolver.socket_pool,
+                                 split_queries=config.split_queries,
+                                 timeout=config.timeout,
+                                 retries=config.retries,
+                                 retry_backoff=config.retry_backoff,
+                                 scheduler=target_settings.nameservers,
+                                 limits=resolver.limits,
+                                 cache=resolver.cache,
+                                 tcp_pool=resolver.tcp_pool)
+
+    if reader:
+        input_reader = reader(queue_input)
+    else:
+        input_reader = create_io_reader(statistics, queue_input, target_settings, config, checkpoint)
+    executor = Executor(statistics, queue_input, queue_prints, target_worker, config.senders)
+    printer = OutputPrinter(config.output_file, statistics if print_statistics else None, queue_prints, io,
+                            create_encoder(config.output_format),
+                            batch_size=config.output_batch, flush_interval=config.flush_interval,
+                            compressor=create_compressor(config.compress, config.compress_level) if compress else None,
+                            checkpoint=checkpoint)
+    await run_workers([input_reader, executor, printer])
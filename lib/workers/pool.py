@@ -0,0 +1,266 @@
+import abc
+import asyncio
+from itertools import count
+from secrets import randbits
+from math import ceil
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ['Deadlines', 'DnsConnection', 'DnsSocket', 'DnsDatagramProtocol', 'DnsTcpConnection', 'DnsSocketPool',
+           'question_section']
+
+DNS_PORT = 53
+MAX_TRANSACTION_IDS = 65536
+DEADLINE_RESOLUTION = 0.01  # seconds, requests expire up to this late
+
+
+def question_section(packet: bytes) -> bytes:
+    """
+    Returns question section(QNAME + QTYPE + QCLASS) of DNS packet with one question
+    """
+    position = 12
+    length = packet[position]
+    while length:
+        position += length + 1
+        length = packet[position]
+    return packet[12:position + 5]
+
+
+class Deadlines:
+    """
+    Timeouts of requests grouped to buckets of resolution seconds: one loop.call_at per bucket
+    instead of timer and extra task of asyncio.wait_for per request
+    """
+
+    def __init__(self, resolution: float = DEADLINE_RESOLUTION):
+        self.resolution = resolution
+        self.buckets: Dict[int, List[asyncio.Future]] = {}
+
+    def add(self, future: asyncio.Future, timeout: float):
+        """
+        Sets asyncio.TimeoutError to future if it is not done after timeout
+        """
+        loop = future.get_loop()
+        bucket = ceil((loop.time() + timeout) / self.resolution)
+        futures = self.buckets.get(bucket)
+        if futures is None:
+            futures = self.buckets[bucket] = []
+            loop.call_at(bucket * self.resolution, self.expire, bucket)
+        futures.append(future)
+
+    def expire(self, bucket: int):
+        for future in self.buckets.pop(bucket, ()):
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+
+class DnsConnection(metaclass=abc.ABCMeta):
+    """
+    Long-lived connection to one nameserver, many requests are in flight at once.
+    Responses are matched to waiting requests by transaction ID and question
+    """
+
+    def __init__(self, deadlines: Optional[Deadlines] = None):
+        self.pending: Dict[int, Tuple[bytes, asyncio.Future]] = {}
+        self.closed = False
+        self.deadlines = deadlines or Deadlines()
+        self.reader: Optional[asyncio.Task] = None
+
+    def new_id(self) -> int:
+        while True:
+            transaction_id = randbits(16)
+            if transaction_id not in self.pending:
+                return transaction_id
+
+    @abc.abstractmethod
+    async def send(self, packet: bytes):
+        pass
+
+    def dispatch(self, data: bytes):
+        if len(data) < 12 or not data[2] & 0x80:
+            return
+        transaction_id = int.from_bytes(data[:2], 'big')
+        waiter = self.pending.get(transaction_id)
+        if not waiter:
+            return
+        question, future = waiter
+        if data[12:12 + len(question)].lower() != question or future.done():
+            return
+        del self.pending[transaction_id]
+        future.set_result(data)
+
+    async def request(self, payload: bytes, timeout: float) -> bytes:
+        """
+        Sends payload with new random transaction ID and waits for matched response
+        """
+        if len(self.pending) >= MAX_TRANSACTION_IDS:
+            raise ConnectionError('no free transaction id')
+        transaction_id = self.new_id()
+        question = question_section(payload).lower()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[transaction_id] = (question, future)
+        self.deadlines.add(future, timeout)
+        try:
+            await self.send(transaction_id.to_bytes(2, 'big') + payload[2:])
+            return await future
+        finally:
+            waiter = self.pending.get(transaction_id)
+            if waiter and waiter[1] is future:
+                del self.pending[transaction_id]
+            # send failed: nobody waits for future, its deadline or close of connection must not set error to it
+            if not future.done():
+                future.cancel()
+            elif not future.cancelled():
+                future.exception()
+
+    @abc.abstractmethod
+    def close_transport(self):
+        pass
+
+    def fail(self, exc: Exception):
+        """
+        Sets error to all waiting requests, connection stays open
+        """
+        for _, future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.close_transport()
+            if self.reader and not self.reader.done() and self.reader is not asyncio.current_task():
+                self.reader.cancel()
+            self.fail(ConnectionError('connection closed'))
+
+
+class DnsDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Passes datagrams of connected UDP socket straight to waiting requests of DnsSocket
+    """
+
+    def __init__(self):
+        self.connection: Optional[DnsSocket] = None
+
+    def datagram_received(self, data: bytes, addr):
+        if self.connection:
+            self.connection.dispatch(data)
+
+    def error_received(self, exc: Exception):
+        # ICMP errors (e.g. port unreachable) can not be matched to query, all waiting requests get the error
+        if self.connection:
+            self.connection.fail(exc)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if self.connection:
+            self.connection.close()
+
+
+class DnsSocket(DnsConnection):
+    """
+    Long-lived UDP socket connected to one nameserver
+    """
+
+    def __init__(self, transport: asyncio.DatagramTransport, protocol: DnsDatagramProtocol,
+                 deadlines: Optional[Deadlines] = None):
+        self.transport = transport
+        super().__init__(deadlines)
+        protocol.connection = self
+
+    async def send(self, packet: bytes):
+        if self.closed:
+            raise ConnectionError('connection closed')
+        self.transport.sendto(packet)
+
+    def close_transport(self):
+        self.transport.close()
+
+
+class DnsTcpConnection(DnsConnection):
+    """
+    Persistent TCP connection to one nameserver (RFC 7766): queries are pipelined with 2 bytes length prefix,
+    responses may come in any order
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 deadlines: Optional[Deadlines] = None):
+        self.stream_reader = reader
+        self.writer = writer
+        super().__init__(deadlines)
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        while True:
+            try:
+                length = int.from_bytes(await self.stream_reader.readexactly(2), 'big')
+                data = await self.stream_reader.readexactly(length)
+            except (asyncio.CancelledError, asyncio.IncompleteReadError, ConnectionError, OSError):
+                # connection is closed by nameserver, waiting requests get error and are retried
+                break
+            self.dispatch(data)
+        self.close()
+
+    async def send(self, packet: bytes):
+        if self.closed:
+            raise ConnectionError('connection closed')
+        self.writer.write(len(packet).to_bytes(2, 'big') + packet)
+        await self.writer.drain()
+
+    def close_transport(self):
+        self.writer.close()
+
+
+class DnsSocketPool:
+    """
+    Pool of long-lived UDP sockets or TCP connections, several of them per nameserver
+    """
+
+    def __init__(self, sockets_per_nameserver: int = 4, transport: str = 'udp'):
+        self.sockets_per_nameserver = max(1, sockets_per_nameserver)
+        self.transport = transport
+        self.sockets: Dict[str, List[Optional[DnsConnection]]] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.counter = count()
+        self.deadlines = Deadlines()  # shared by all connections of pool
+
+    async def connect(self, nameserver: str) -> DnsConnection:
+        if self.transport == 'tcp':
+            reader, writer = await asyncio.open_connection(nameserver, DNS_PORT)
+            return DnsTcpConnection(reader, writer, self.deadlines)
+        transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            DnsDatagramProtocol, remote_addr=(nameserver, DNS_PORT))
+        return DnsSocket(transport, protocol, self.deadlines)
+
+    def get(self, nameserver: str) -> Optional[DnsConnection]:
+        """
+        Returns open socket for nameserver without waiting, None if it has to be created by acquire
+        """
+        sockets = self.sockets.get(nameserver)
+        if sockets is None:
+            return None
+        dns_socket = sockets[next(self.counter) % self.sockets_per_nameserver]
+        return dns_socket if dns_socket is not None and not dns_socket.closed else None
+
+    async def acquire(self, nameserver: str) -> DnsConnection:
+        """
+        Returns open socket for nameserver, sockets are created lazily and reopened after errors
+        """
+        sockets = self.sockets.get(nameserver)
+        if sockets is None:
+            sockets = self.sockets[nameserver] = [None] * self.sockets_per_nameserver
+            self.locks[nameserver] = asyncio.Lock()
+        index = next(self.counter) % self.sockets_per_nameserver
+        dns_socket = sockets[index]
+        if dns_socket is None or dns_socket.closed:
+            async with self.locks[nameserver]:
+                dns_socket = sockets[index]
+                if dns_socket is None or dns_socket.closed:
+                    dns_socket = sockets[index] = await self.connect(nameserver)
+        return dns_socket
+
+    def close(self):
+        for sockets in self.sockets.values():
+            for dns_socket in sockets:
+                if dns_socket:
+                    dns_socket.close()
+        self.sockets.clear()
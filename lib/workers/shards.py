@@ -0,0 +1,165 @@
+import asyncio
+import multiprocessing
+from queue import Empty
+from sys import stdin, stderr, stdout
+from threading import Thread
+from typing import Dict, Iterator, List, Optional
+from zlib import crc32
+
+import uvloop
+from ujson import dumps as ujson_dumps
+
+from lib.core import AppConfig, TargetConfig, Stats, merge_stats
+from lib.util import abort
+from .tasks import TargetReader, InputProducer
+from .pipeline import Resolver, run_pipeline
+from .writers import create_encoder, create_compressor
+
+__all__ = ['TargetQueueReader', 'ShardOutput', 'run_shard', 'run_sharded']
+
+SHARD_CHUNK = 1000  # lines sent to child process at once
+SHARD_DATA = 'data'
+SHARD_DONE = 'done'
+
+
+class TargetQueueReader(TargetReader):
+    """
+    Reads chunks of raw input messages sent by parent process, None - end of input
+    """
+
+    def __init__(self, stats: Stats, input_queue: asyncio.Queue, producer: InputProducer,
+                 chunks: multiprocessing.Queue):
+        super().__init__(stats, input_queue, producer)
+        self.chunks = chunks
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lines = await loop.run_in_executor(None, self.chunks.get)
+            if lines is None:
+                break
+            for linein in lines:
+                await self.producer.send(linein)
+        await self.producer.send_stop()
+
+
+class ShardOutput:
+    """
+    Output of child process for OutputPrinter: encoded batches are sent to parent process
+    """
+
+    def __init__(self, index: int, results: multiprocessing.Queue):
+        self.index = index
+        self.results = results
+
+    async def write(self, data: bytes):
+        await asyncio.get_running_loop().run_in_executor(None, self.results.put, (self.index, SHARD_DATA, data))
+
+
+async def run_shard_pipeline(index: int, target_settings: TargetConfig, config: AppConfig,
+                             chunks: multiprocessing.Queue, results: multiprocessing.Queue) -> Optional[Dict]:
+    statistics = Stats(nameservers=target_settings.nameservers) if config.statistics else None
+    resolver = Resolver(config)
+
+    def create_reader(queue_input: asyncio.Queue) -> TargetReader:
+        producer = InputProducer(statistics, queue_input, target_settings)
+        return TargetQueueReader(statistics, queue_input, producer, chunks)
+
+    # statistics and compression are done by parent process
+    await run_pipeline(target_settings, config, resolver, statistics, ShardOutput(index, results),
+                       reader=create_reader, compress=False, print_statistics=False)
+    resolver.close()
+    return statistics.dict() if statistics else None
+
+
+def run_shard(index: int, target_settings: TargetConfig, config: AppConfig,
+              chunks: multiprocessing.Queue, results: multiprocessing.Queue):
+    """
+    Entry point of child process: runs pipeline for its shard of input
+    """
+    uvloop.install()
+    statistics = asyncio.run(run_shard_pipeline(index, target_settings, config, chunks, results))
+    results.put((index, SHARD_DONE, statistics))
+
+
+def read_lines(config: AppConfig) -> Iterator[str]:
+    if config.single_targets:
+        yield from config.single_targets
+    elif config.input_stdin:
+        yield from stdin
+    elif config.input_file:
+        with open(config.input_file, 'rt') as f:
+            yield from f
+
+
+def feed_shards(config: AppConfig, queues: List[multiprocessing.Queue]):
+    """
+    Splits input between child processes: by hash of hostname, so repeated hostnames meet cache of one worker,
+    or by round-robin chunks of lines
+    """
+    buffers: List[List[str]] = [[] for _ in queues]
+    count_lines = 0
+    for line in read_lines(config):
+        linein = line.strip()
+        if not linein:
+            continue
+        if config.shard_by == 'hash':
+            index = crc32(linein.lower().encode('utf-8', 'replace')) % len(queues)
+        else:
+            index = (count_lines // SHARD_CHUNK) % len(queues)
+        count_lines += 1
+        buffers[index].append(linein)
+        if len(buffers[index]) >= SHARD_CHUNK:
+            queues[index].put(buffers[index])
+            buffers[index] = []
+    for index, queue in enumerate(queues):
+        if buffers[index]:
+            queue.put(buffers[index])
+        queue.put(None)
+
+
+def run_sharded(target_settings: TargetConfig, config: AppConfig):
+    """
+    Runs config.workers child processes with own event loops, parent process shards input between them
+    and writes their results (unordered) to one output, statistics of workers are aggregated
+    """
+    chunks = [multiprocessing.Queue(maxsize=4) for _ in range(config.workers)]
+    results = multiprocessing.Queue(maxsize=config.workers * 4)
+    processes = [multiprocessing.Process(target=run_shard, daemon=True,
+                                         args=(index, target_settings, config, chunks[index], results))
+                 for index in range(config.workers)]
+    for process in processes:
+        process.start()
+    feeder = Thread(target=feed_shards, args=(config, chunks), daemon=True)
+    feeder.start()
+
+    compressor = create_compressor(config.compress, config.compress_level)
+    statistics: List[Dict] = []
+    running = config.workers
+    with open(config.output_file, config.write_mode) as output:
+        while running:
+            try:
+                _, kind, payload = results.get(timeout=1)
+            except Empty:
+                if any(process.exitcode for process in processes):
+                    for process in processes:
+                        process.terminate()
+                    abort('ERROR: worker process failed')
+                continue
+            if kind == SHARD_DATA:
+                output.write(compressor.compress(payload) if compressor else payload)
+            else:
+                running -= 1
+                if payload:
+                    statistics.append(payload)
+        if compressor:
+            output.write(compressor.flush())
+        for process in processes:
+            process.join()
+
+        if config.statistics:
+            result = ujson_dumps(merge_stats(statistics))
+            if config.output_file == '/dev/stdout' and create_encoder(config.output_format).text and not compressor:
+                output.write(result.encode('utf-8') + b'\n')
+            else:
+                print(result, file=stderr if config.output_file == '/dev/stdout' else stdout)
@@ -1,28 +1,38 @@
 import abc
 import asyncio
 from abc import ABC
+from ipaddress import ip_address
 from asyncio import Queue
-from base64 import b64encode
 # noinspection PyUnresolvedReferences,PyProtectedMember
 from ssl import _create_unverified_context as ssl_create_unverified_context
-from typing import Optional, Callable, Any, Coroutine, Dict
-import asyncio_dgram
+from random import uniform
+from sys import stderr, stdout
+from typing import Optional, Dict, Iterable, Tuple, List
 from aioconsole import ainput
 from aiofiles import open as aiofiles_open
 from ujson import dumps as ujson_dumps
-from msgpack import dumps as msgpack_dumps
 
 
-from lib.core import validate_domain, create_error_template, make_document_from_response, Stats, AppConfig, \
-    Target, TargetConfig
-from lib.util import access_dot_path, is_ip, is_network, single_read, multi_read, \
-    filter_bytes, write_to_file, write_to_stdout
-from .factories import create_targets_dns_protocol
+from lib.core import classify_target, TARGET_IPV4, TARGET_IPV6, TARGET_CIDR, TARGET_FQDN, TARGET_IDN, \
+    create_error_template, make_document_from_response, merge_documents, Stats, \
+    AppConfig, Target, TargetConfig, NameserverScheduler, AnswerCache, OUTCOME_OK, OUTCOME_TIMEOUT, OUTCOME_ERROR, \
+    strip_edns, response_edns_bufsize
+from lib.util import access_dot_path, iter_network_hosts, single_read, multi_read, \
+    filter_bytes
+from .factories import create_targets_dns_protocol, create_ptr_target
+from .pool import DnsSocketPool, DnsConnection
+from .limits import NameserverLimits
+from .writers import RecordEncoder, Compressor
+from .checkpoint import Checkpoint, Marked
 
-__all__ = ['QueueWorker', 'TargetReader', 'TargetFileReader', 'TargetStdinReader', 'TaskProducer', 'Executor',
-           'OutputPrinter', 'TargetWorker', 'create_io_reader', 'get_async_writer']
+__all__ = ['QueueWorker', 'TargetReader', 'TargetFileReader', 'TargetIterableReader', 'TargetStdinReader',
+           'Executor', 'OutputPrinter', 'TargetWorker', 'create_io_reader', 'run_workers']
 
 STOP_SIGNAL = b'check for end'
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_REFUSED = 5
+FLAG_TC = 0x02  # TC bit in third byte of header
 
 
 class QueueWorker(metaclass=abc.ABCMeta):
@@ -39,28 +49,67 @@ class InputProducer:
     Produces raw messages for workers
     """
 
-    def __init__(self, stats: Stats, input_queue: Queue, target_conf: TargetConfig, send_limit: int, queue_sleep: int):
+    def __init__(self, stats: Stats, input_queue: Queue, target_conf: TargetConfig,
+                 checkpoint: Optional[Checkpoint] = None):
         self.stats = stats
         self.input_queue = input_queue
         self.target_conf = target_conf
-        self.send_limit = send_limit
-        self.queue_sleep = queue_sleep
-
-    async def send(self, linein):
-        if any([is_ip(linein), is_network(linein), validate_domain(linein)]):
-            targets = create_targets_dns_protocol([linein], self.target_conf)  # generator
-            if targets:
-                for target in targets:
-                    check_queue = True
-                    while check_queue:
-                        size_queue = self.input_queue.qsize()
-                        if size_queue < self.send_limit:
-                            if self.stats:
-                                self.stats.count_input += 1
-                            self.input_queue.put_nowait(target)
-                            check_queue = False
-                        else:
-                            await asyncio.sleep(self.queue_sleep)
+        self.checkpoint = checkpoint
+
+    async def put(self, targets):
+        """
+        Puts targets to bounded input queue, waits until consumers free a slot
+        """
+        if self.input_queue.full():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await self.input_queue.put(targets)
+            if self.stats:
+                self.stats.time_blocked += loop.time() - started
+        else:
+            self.input_queue.put_nowait(targets)
+
+    async def send(self, linein, offset: Optional[int] = None):
+        """
+        offset - end of line in input file, it is passed along with targets to mark line as done after output.
+        IP addresses are resolved with PTR query, networks are expanded to PTR queries of their hosts lazily
+        """
+        kind = classify_target(linein)
+        if kind == TARGET_FQDN or kind == TARGET_IDN:
+            # all query types of one hostname are sent together
+            targets = tuple(create_targets_dns_protocol([linein], self.target_conf))
+        elif kind == TARGET_IPV4:
+            targets = (create_ptr_target(linein, self.target_conf),)
+        elif kind == TARGET_IPV6:
+            targets = (create_ptr_target(str(ip_address(linein)), self.target_conf),)
+        elif kind == TARGET_CIDR:
+            await self.send_network(linein, offset)
+            return
+        else:
+            targets = ()
+        if targets:
+            if self.stats:
+                self.stats.count_input += 1
+            await self.put(targets if offset is None else Marked(targets, offset))
+        elif offset is not None:
+            self.checkpoint.complete([offset])
+
+    async def send_network(self, linein, offset: Optional[int] = None):
+        """
+        Every host of network is separate PTR query, bounded input queue holds back expansion of big networks
+        """
+        for address in iter_network_hosts(linein):
+            targets = (create_ptr_target(address, self.target_conf),)
+            if self.stats:
+                self.stats.count_input += 1
+            if offset is None:
+                await self.put(targets)
+            else:
+                self.checkpoint.add(offset)
+                await self.put(Marked(targets, offset))
+        if offset is not None:
+            # line itself is done when all its hosts are done
+            self.checkpoint.complete([offset])
 
     async def send_stop(self):
         await self.input_queue.put(STOP_SIGNAL)
@@ -82,16 +131,51 @@ class TargetFileReader(TargetReader):
     Reads raw input messages from text file
     """
 
-    def __init__(self, stats: Stats, input_queue: Queue, producer: InputProducer, file_path: str):
+    def __init__(self, stats: Stats, input_queue: Queue, producer: InputProducer, file_path: str,
+                 checkpoint: Optional[Checkpoint] = None):
         super().__init__(stats, input_queue, producer)
         self.file_path = file_path
+        self.checkpoint = checkpoint
 
     async def run(self):
-        async with aiofiles_open(self.file_path, mode='rt') as f:
+        if self.checkpoint:
+            await self.run_from_checkpoint()
+        else:
+            async with aiofiles_open(self.file_path, mode='rt') as f:
+                async for line in f:
+                    linein = line.strip()
+                    await self.producer.send(linein)
+
+        await self.producer.send_stop()
+
+    async def run_from_checkpoint(self):
+        """
+        Reads file from offset of checkpoint, every line is sent with its end offset
+        """
+        offset = self.checkpoint.offset
+        async with aiofiles_open(self.file_path, mode='rb') as f:
+            await f.seek(offset)
             async for line in f:
-                linein = line.strip()
-                await self.producer.send(linein)
+                offset += len(line)
+                self.checkpoint.read(offset)
+                linein = line.decode('utf-8', 'replace').strip()
+                await self.producer.send(linein, offset)
 
+
+class TargetIterableReader(TargetReader):
+    """
+    Reads raw input messages from iterable of lines, e.g. payload decoded in memory
+    """
+
+    def __init__(self, stats: Stats, input_queue: Queue, producer: InputProducer, lines: Iterable[str]):
+        super().__init__(stats, input_queue, producer)
+        self.lines = lines
+
+    async def run(self):
+        for line in self.lines:
+            linein = line.strip()
+            if linein:
+                await self.producer.send(linein)
         await self.producer.send_stop()
 
 
@@ -133,84 +217,144 @@ class TargetStdinReader(TargetReader):
                 break
 
 
-class TaskProducer(QueueWorker):
+class Executor(QueueWorker):
     """
-    Creates tasks for tasks queue
+    Fixed-size pool of consumers, each consumer takes targets from input queue and launch execution for them
     """
 
-    def __init__(self, stats: Stats, in_queue: Queue, tasks_queue: Queue, worker: 'TargetWorker'):
+    def __init__(self, stats: Stats, in_queue: Queue, out_queue: Queue, worker: 'TargetWorker', consumers: int):
         super().__init__(stats)
         self.in_queue = in_queue
-        self.tasks_queue = tasks_queue
+        self.out_queue = out_queue
         self.worker = worker
+        self.consumers = max(1, consumers)
 
-    async def run(self):
+    async def consume(self):
         while True:
-            # wait for an item from the "start_application"
-            target = await self.in_queue.get()
-            if target == STOP_SIGNAL:
-                await self.tasks_queue.put(STOP_SIGNAL)
+            targets = await self.in_queue.get()
+            if targets == STOP_SIGNAL:
+                # leave signal for other consumers
+                self.in_queue.put_nowait(STOP_SIGNAL)
                 break
-            if target:
-                coro = self.worker.do(target)
-                task = asyncio.create_task(coro)
-                await self.tasks_queue.put(task)
-
-
-class Executor(QueueWorker):
-    """
-    Gets tasks from tasks queue and launch execution for each of them
-    """
-
-    def __init__(self, stats: Stats, tasks_queue: Queue, out_queue: Queue):
-        super().__init__(stats)
-        self.tasks_queue = tasks_queue
-        self.out_queue = out_queue
+            if isinstance(targets, Marked):
+                await self.worker.do(targets.targets)
+                # results of line are already in output queue, mark goes after them
+                await self.out_queue.put(Marked((), targets.offset))
+            elif targets:
+                await self.worker.do(targets)
 
     async def run(self):
-        while True:
-            # wait for an item from the "start_application"
-            task = await self.tasks_queue.get()
-            if task == STOP_SIGNAL:
-                await self.out_queue.put(STOP_SIGNAL)
-                break
-            if task:
-                await task
+        consumers = [asyncio.create_task(self.consume()) for _ in range(self.consumers)]
+        try:
+            await asyncio.gather(*consumers)
+        except BaseException:
+            # failed consumer stops all of them, error goes to run_workers
+            for consumer in consumers:
+                consumer.cancel()
+            raise
+        await self.out_queue.put(STOP_SIGNAL)
 
 
 class OutputPrinter(QueueWorker):
     """
-    Takes results from results queue and put them to output
+    Takes results from results queue and put them to output.
+    Results are collected to batch, batch is encoded (and compressed) in thread and written with one write
+    when it reaches batch_size documents or flush_interval seconds passed since first result in it.
+    Next batch is collected while previous is encoded and written
     """
 
-    def __init__(self, output_file:str, stats: Stats, in_queue: Queue, io, async_writer) -> None:
+    def __init__(self, output_file: str, stats: Stats, in_queue: Queue, io, encoder: RecordEncoder,
+                 batch_size: int = 5000, flush_interval: float = 1.0, compressor: Optional[Compressor] = None,
+                 checkpoint: Optional[Checkpoint] = None) -> None:
         super().__init__(stats)
         self.in_queue = in_queue
-        self.async_writer = async_writer
+        self.encoder = encoder
+        self.compressor = compressor
+        self.checkpoint = checkpoint
         self.io = io
         self.output_file = output_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writing: Optional[asyncio.Task] = None
+
+    def encode(self, records: List[Dict], last: bool = False) -> bytes:
+        data = self.encoder.encode(records) if records else b''
+        if last:
+            data += self.encoder.close()
+        if self.compressor:
+            data = self.compressor.compress(data)
+            if last:
+                data += self.compressor.flush()
+        return data
+
+    async def write(self, records: List[Dict], last: bool = False, marks: Optional[List[int]] = None):
+        data = b''
+        if records or last:
+            data = await asyncio.get_running_loop().run_in_executor(None, self.encode, records, last)
+        if data:
+            await self.io.write(data)
+        if self.checkpoint:
+            # lines of marks are written, checkpoint is saved only after output is flushed to file
+            self.checkpoint.complete(marks or [])
+            if last or self.checkpoint.due():
+                await self.io.flush()
+                self.checkpoint.save()
+
+    async def flush(self, records: List[Dict], last: bool = False, marks: Optional[List[int]] = None):
+        if self.writing:
+            await self.writing
+            self.writing = None
+        if records or last or marks:
+            self.writing = asyncio.create_task(self.write(records, last, marks))
 
     async def run(self):
+        try:
+            await self.print_records()
+        finally:
+            if self.writing and not self.writing.done():
+                self.writing.cancel()
+
+    async def print_records(self):
+        loop = asyncio.get_running_loop()
+        records: List[Dict] = []
+        marks: List[int] = []  # offsets of input lines, which results are in records
+        deadline = 0.0
         while True:
-            line = await self.in_queue.get()
-            if line == STOP_SIGNAL:
+            try:
+                record = self.in_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if records or marks:
+                    try:
+                        record = await asyncio.wait_for(self.in_queue.get(), timeout=max(0.0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        await self.flush(records, marks=marks)
+                        records, marks = [], []
+                        continue
+                else:
+                    record = await self.in_queue.get()
+            if record == STOP_SIGNAL:
                 break
-            if line:
-                await self.async_writer(self.io, line)
+            if isinstance(record, Marked):
+                if not records and not marks:
+                    deadline = loop.time() + self.flush_interval
+                marks.append(record.offset)
+            elif record:
+                if not records and not marks:
+                    deadline = loop.time() + self.flush_interval
+                records.append(record)
+                if len(records) >= self.batch_size:
+                    await self.flush(records, marks=marks)
+                    records, marks = [], []
+        await self.flush(records, last=True, marks=marks)
+        await self.flush([])
 
         await asyncio.sleep(0.5)
         if self.stats:
             statistics = self.stats.dict()
-            if self.output_file == '/dev/stdout':
+            if self.output_file == '/dev/stdout' and self.encoder.text and not self.compressor:
                 await self.io.write(ujson_dumps(statistics).encode('utf-8') + b'\n')
             else:
-                async with aiofiles_open('/dev/stdout', mode='wb') as stats:
-                    await stats.write(ujson_dumps(statistics).encode('utf-8') + b'\n')
-
-
-def pack_dict_to_msgpack_string(value: Dict) -> str:
-    result_msg: bytes = msgpack_dumps(value)
-    return b64encode(result_msg).decode('ascii')
+                print(ujson_dumps(statistics), file=stderr if self.output_file == '/dev/stdout' else stdout)
 
 
 class TargetWorker:
@@ -219,12 +363,24 @@ class TargetWorker:
     """
 
     def __init__(self, stats: Stats, semaphore: asyncio.Semaphore, output_queue: asyncio.Queue,
-                 success_only: bool, use_msgpack: bool = False):
+                 success_only: bool, pool: Optional[DnsSocketPool] = None,
+                 split_queries: bool = False, timeout: float = 2, retries: int = 0, retry_backoff: float = 0.1,
+                 scheduler: Optional[NameserverScheduler] = None, limits: Optional[NameserverLimits] = None,
+                 cache: Optional[AnswerCache] = None, tcp_pool: Optional[DnsSocketPool] = None):
         self.stats = stats
         self.semaphore = semaphore
+        self.pool = pool or DnsSocketPool()
+        self.tcp_pool = tcp_pool  # truncated UDP responses are repeated over TCP
+        self.split_queries = split_queries
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.scheduler = scheduler
+        self.limits = limits
+        self.cache = cache
+        self.inflight: Dict[Tuple[str, str], asyncio.Future] = {}
         self.output_queue = output_queue
         self.success_only: bool = success_only
-        self.function_pack: Callable = pack_dict_to_msgpack_string if use_msgpack else ujson_dumps
 
     async def send_result(self, result: Optional[Dict]):
         if result:
@@ -247,58 +403,191 @@ class TargetWorker:
                 record = result
 
             if record:
-                record_out: str = self.function_pack(record)
-                await self.output_queue.put(record_out)
+                await self.output_queue.put(record)
+
+    async def do(self, targets: Tuple[Target, ...]):
+        """
+        Resolves all query types of one hostname, sends one merged document or one document per query type
+        """
+        if len(targets) == 1:
+            await self.send_result(await self.resolve(targets[0]))
+        else:
+            results = await asyncio.gather(*[self.resolve(target) for target in targets])
+            if self.split_queries:
+                for result in results:
+                    await self.send_result(result)
+            else:
+                await self.send_result(merge_documents(targets, results))
+
+    def next_nameserver(self, nameserver: str) -> str:
+        """
+        Returns another healthy nameserver for retry
+        """
+        if self.scheduler:
+            return self.scheduler.select(exclude=nameserver)
+        return nameserver
+
+    def report(self, target: Target, started: float, outcome: str):
+        if self.scheduler:
+            self.scheduler.report(target.nameserver, asyncio.get_running_loop().time() - started, outcome)
+
+    async def resolve(self, target: Target) -> Dict:
+        """
+        Returns document for target: from cache, from the same query which is already in flight or sends new query.
+        On timeout or socket errors query is retried with the next nameserver after exponential backoff with jitter
+        """
+        if self.cache is not None:
+            cached = self.cache.get(target.hostname, target.qtype)
+            if self.stats:
+                if cached:
+                    self.stats.count_cache_hits += 1
+                else:
+                    self.stats.count_cache_misses += 1
+            if cached:
+                data, nameserver = cached
+                return make_document_from_response(data, target._replace(nameserver=nameserver), protocol='dns')
+        key = (target.hostname, target.qtype)
+        future = self.inflight.get(key)
+        if future is not None:
+            # the same query is already in flight: wait for its result
+            if self.stats:
+                self.stats.count_coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # first query failed unexpectedly, send own query
+            return await self.resolve_with_retries(target)
+        future = self.inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self.resolve_with_retries(target)
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.cancel()
+            del self.inflight[key]
+
+    async def resolve_with_retries(self, target: Target) -> Dict:
+        attempt = 0
+        while True:
+            result, retryable = await self.query(target)
+            if not retryable or attempt >= self.retries:
+                return result
+            attempt += 1
+            if self.stats:
+                self.stats.count_retries += 1
+            await asyncio.sleep(uniform(0, self.retry_backoff * 2 ** attempt))
+            target = target._replace(nameserver=self.next_nameserver(target.nameserver))
+
+    async def acquire_nameserver(self, target: Target) -> Target:
+        """
+        Takes limits of nameserver, throttled nameserver of target is replaced with one which has free limits.
+        Waits for limits only if all nameservers are throttled
+        """
+        if self.scheduler and not self.limits.available(target.nameserver):
+            nameserver = self.scheduler.select(exclude=target.nameserver, available=self.limits.available)
+            if nameserver:
+                target = target._replace(nameserver=nameserver)
+        await self.limits.acquire(target.nameserver)
+        return target
+
+    async def query(self, target: Target) -> Tuple[Dict, bool]:
+        """
+        Sends query within limits of nameserver and global limit of senders.
+        Nameserver is chosen at send time and its limits are taken before sender slot, so nobody waits holding it
+        """
+        if not self.limits:
+            async with self.semaphore:
+                return await self.exchange(target)
+        target = await self.acquire_nameserver(target)
+        try:
+            async with self.semaphore:
+                return await self.exchange(target)
+        finally:
+            self.limits.release(target.nameserver)
+
+    async def connection(self, pool: DnsSocketPool, nameserver: str) -> DnsConnection:
+        """
+        Returns open socket of pool, waits for it within timeout only if it has to be created
+        """
+        return pool.get(nameserver) or await asyncio.wait_for(pool.acquire(nameserver), timeout=self.timeout)
 
     # noinspection PyBroadException
-    async def do(self, target: Target):
+    async def exchange(self, target: Target) -> Tuple[Dict, bool]:
         """
-        сопрограмма, осуществляет подключение к Target, отправку и прием данных, формирует результата в виде dict
+        сопрограмма, осуществляет отправку запроса к Target через пул сокетов и прием ответа, формирует результата в виде dict,
+        второе значение - можно ли повторить запрос
         """
-        async with self.semaphore:
-            result = None
-            future_connection = asyncio_dgram.connect((target.nameserver, 53))
+        started = asyncio.get_running_loop().time()
+        try:
+            dns_socket = await self.connection(self.pool, target.nameserver)
+        except:
+            self.report(target, started, OUTCOME_TIMEOUT)
+            return create_error_template(target, 'unknown'), True
+        stripped = strip_edns(target.payload)  # the same object if query has no OPT record
+        payload = stripped if self.scheduler and not self.scheduler.edns(target.nameserver) else target.payload
+        try:
+            data = await dns_socket.request(payload, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.report(target, started, OUTCOME_TIMEOUT)
+            return create_error_template(target, 'timeout'), True
+        except Exception as e:
+            self.report(target, started, OUTCOME_TIMEOUT)
+            return create_error_template(target, str(e)), True
+        rcode = data[3] & 0x0f
+        edns = payload is not stripped
+        if rcode == RCODE_FORMERR and edns:
+            # nameserver without EDNS0: query is repeated and the next queries are sent without OPT record
+            if self.scheduler:
+                self.scheduler.report_edns(target.nameserver, None, supported=False)
+            payload = stripped
             try:
-                stream = await asyncio.wait_for(future_connection, timeout=1.5)
-            except:
-                result = create_error_template(target, 'unknown')
-            else:
-                try:
-                    await stream.send(target.payload)
-                    future_connection = stream.recv()
-                    try:
-                        data, remote_addr = await asyncio.wait_for(future_connection, timeout=1.5)
-                    except asyncio.TimeoutError:
-                        await asyncio.sleep(0.005)
-                        try:
-                            stream.close()
-                            del stream
-                        except Exception as e:
-                            pass
-                        result = create_error_template(target, 'timeout')
-                    else:
-                        result = make_document_from_response(data, target, protocol='dns')
-                        stream.close()
-                except Exception as e:
-                    await asyncio.sleep(0.005)
-                    try:
-                        stream.close()
-                        del stream
-                    except Exception as e:
-                        pass
-                    result = create_error_template(target, str(e))
-            if result:
-                await self.send_result(result)
+                data = await dns_socket.request(payload, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.report(target, started, OUTCOME_TIMEOUT)
+                return create_error_template(target, 'timeout'), True
+            except Exception as e:
+                self.report(target, started, OUTCOME_TIMEOUT)
+                return create_error_template(target, str(e)), True
+            rcode = data[3] & 0x0f
+        elif edns and self.scheduler:
+            try:
+                self.scheduler.report_edns(target.nameserver, response_edns_bufsize(data))
+            except Exception:
+                pass
+        self.report(target, started, OUTCOME_ERROR if rcode in (RCODE_SERVFAIL, RCODE_REFUSED) else OUTCOME_OK)
+        if data[2] & FLAG_TC and self.tcp_pool is not None:
+            data = await self.exchange_tcp(target, payload, data)
+        if self.cache is not None:
+            self.cache.put(target.hostname, target.qtype, target.nameserver, data)
+        return make_document_from_response(data, target, protocol='dns'), False
+
+    async def exchange_tcp(self, target: Target, payload: bytes, truncated: bytes) -> bytes:
+        """
+        Repeats query with truncated response over TCP, truncated response is used if TCP fails
+        """
+        if self.stats:
+            self.stats.count_tcp_fallbacks += 1
+        try:
+            connection = await self.connection(self.tcp_pool, target.nameserver)
+            return await connection.request(payload, timeout=self.timeout)
+        except Exception:
+            return truncated
 
 
-def create_io_reader(stats: Stats, queue_input: Queue, target: TargetConfig, app_config: AppConfig) -> TargetReader:
-    message_producer = InputProducer(stats, queue_input, target, app_config.senders - 1, app_config.queue_sleep)
+def create_io_reader(stats: Stats, queue_input: Queue, target: TargetConfig, app_config: AppConfig,
+                     checkpoint: Optional[Checkpoint] = None) -> TargetReader:
+    message_producer = InputProducer(stats, queue_input, target, checkpoint)
     if app_config.input_stdin:
         return TargetStdinReader(stats, queue_input, message_producer)
     if app_config.single_targets:
         return TargetSingleReader(stats, queue_input, message_producer, app_config.single_targets)
+    if app_config.input_lines is not None:
+        return TargetIterableReader(stats, queue_input, message_producer, app_config.input_lines)
     elif app_config.input_file:
-        return TargetFileReader(stats, queue_input, message_producer, app_config.input_file)
+        return TargetFileReader(stats, queue_input, message_producer, app_config.input_file, checkpoint)
     else:
         # TODO : rethink...
         print("""errors, set input source:
@@ -308,7 +597,16 @@ def create_io_reader(stats: Stats, queue_input: Queue, target: TargetConfig, app
         exit(1)
 
 
-def get_async_writer(app_settings: AppConfig) -> Callable[[Any, str], Coroutine]:
-    if app_settings.write_mode == 'a':
-        return write_to_file
-    return write_to_stdout
+async def run_workers(workers: Iterable[QueueWorker]):
+    """
+    Runs stages of pipeline until all of them are done. If one of them fails the others are cancelled
+    (they would wait on bounded queues forever) and its error is raised
+    """
+    running_tasks = [asyncio.create_task(worker.run()) for worker in workers]
+    done, pending = await asyncio.wait(running_tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
@@ -0,0 +1,245 @@
+import abc
+from base64 import b64encode
+import zlib
+from typing import Dict, List, Optional
+
+from msgpack import dumps as msgpack_dumps
+from ujson import dumps as ujson_dumps
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ['RecordEncoder', 'JsonLinesEncoder', 'MsgpackBase64Encoder',
+           'MsgpackStreamEncoder', 'ArrowEncoder', 'ParquetEncoder', 'create_encoder', 'document_to_row',
+           'pack_dict_to_msgpack_string', 'Compressor', 'GzipCompressor', 'ZstdCompressor', 'create_compressor']
+
+def pack_dict_to_msgpack_string(value: Dict) -> str:
+    result_msg: bytes = msgpack_dumps(value)
+    return b64encode(result_msg).decode('ascii')
+
+
+class RecordEncoder(metaclass=abc.ABCMeta):
+    """
+    Encodes batches of result documents to bytes of output stream
+    """
+    text = False
+
+    @abc.abstractmethod
+    def encode(self, records: List[Dict]) -> bytes:
+        pass
+
+    def close(self) -> bytes:
+        """
+        Returns tail of output stream
+        """
+        return b''
+
+
+class JsonLinesEncoder(RecordEncoder):
+    """
+    One json document per line
+    """
+    text = True
+
+    def encode(self, records: List[Dict]) -> bytes:
+        return ('\n'.join([ujson_dumps(record) for record in records]) + '\n').encode('utf-8')
+
+
+class MsgpackBase64Encoder(RecordEncoder):
+    """
+    One base64 encoded msgpack document per line (--use-msgpack)
+    """
+    text = True
+
+    def encode(self, records: List[Dict]) -> bytes:
+        return ('\n'.join([pack_dict_to_msgpack_string(record) for record in records]) + '\n').encode('ascii')
+
+
+class MsgpackStreamEncoder(RecordEncoder):
+    """
+    Stream of msgpack documents, every document is prefixed by its length: 4 bytes, big-endian
+    """
+
+    def encode(self, records: List[Dict]) -> bytes:
+        chunks = []
+        for record in records:
+            packed = msgpack_dumps(record)
+            chunks.append(len(packed).to_bytes(4, 'big'))
+            chunks.append(packed)
+        return b''.join(chunks)
+
+
+def document_to_row(document: Dict) -> Dict:
+    """
+    Flattens result document to row of columnar formats, documents with several query types are merged
+    """
+    dns = document['data']['dns']
+    qtype = dns['type']
+    if isinstance(qtype, list):
+        results = [value.get('result') or {} for value in dns['result'].values()]
+        qtype = ','.join(qtype)
+    else:
+        results = [dns.get('result') or {}]
+    ipv4, ipv6, cname = [], [], []
+    for result in results:
+        ipv4.extend(result.get('ipv4', []))
+        ipv6.extend(result.get('ipv6', []))
+        cname.extend(result.get('cname', []))
+    return {'datetime': document['datetime'],
+            'hostname': document['hostname'],
+            'nameserver': document['nameserver'],
+            'type': qtype,
+            'status': dns['status'],
+            'error': dns.get('error'),
+            'ipv4': ipv4,
+            'ipv6': ipv6,
+            'cname': cname,
+            'result': ujson_dumps(dns['result']) if 'result' in dns else None}
+
+
+class ChunkSink:
+    """
+    Write-only file object for pyarrow writers: keeps written chunks until drain(), tell() is position in whole stream
+    """
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ArrowEncoder(RecordEncoder):
+    """
+    Arrow IPC stream, every batch of documents is one record batch
+    """
+
+    def __init__(self):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required for columnar output formats')
+        self.schema = pyarrow.schema([('datetime', pyarrow.int64()),
+                                      ('hostname', pyarrow.string()),
+                                      ('nameserver', pyarrow.string()),
+                                      ('type', pyarrow.string()),
+                                      ('status', pyarrow.string()),
+                                      ('error', pyarrow.string()),
+                                      ('ipv4', pyarrow.list_(pyarrow.uint32())),
+                                      ('ipv6', pyarrow.list_(pyarrow.string())),
+                                      ('cname', pyarrow.list_(pyarrow.string())),
+                                      ('result', pyarrow.string())])
+        self.sink = ChunkSink()
+        self.writer = self.create_writer()
+
+    def create_writer(self):
+        return pyarrow.ipc.new_stream(self.sink, self.schema)
+
+    def write_table(self, table: 'pyarrow.Table'):
+        self.writer.write_table(table)
+
+    def encode(self, records: List[Dict]) -> bytes:
+        rows = [document_to_row(record) for record in records]
+        table = pyarrow.Table.from_pylist(rows, schema=self.schema)
+        self.write_table(table)
+        return self.sink.drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+
+class ParquetEncoder(ArrowEncoder):
+    """
+    Parquet file, every batch of documents is one row group
+    """
+
+    def create_writer(self):
+        return pyarrow.parquet.ParquetWriter(self.sink, self.schema)
+
+    def write_table(self, table: 'pyarrow.Table'):
+        self.writer.write_table(table, row_group_size=max(1, table.num_rows))
+
+
+def create_encoder(output_format: str) -> RecordEncoder:
+    if output_format == 'msgpack':
+        return MsgpackBase64Encoder()
+    if output_format == 'msgpack-stream':
+        return MsgpackStreamEncoder()
+    if output_format == 'arrow':
+        return ArrowEncoder()
+    if output_format == 'parquet':
+        return ParquetEncoder()
+    return JsonLinesEncoder()
+
+
+class Compressor(metaclass=abc.ABCMeta):
+    """
+    Streaming compressor of output: every chunk is compressed as soon as it is encoded
+    """
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def flush(self) -> bytes:
+        pass
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: Optional[int] = None):
+        self.compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: Optional[int] = None):
+        if zstandard is None:
+            raise ImportError('zstandard is required for zstd compression')
+        self.compressor = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+
+def create_compressor(compress: Optional[str], level: Optional[int] = None) -> Optional[Compressor]:
+    if compress == 'gzip':
+        return GzipCompressor(level)
+    if compress == 'zstd':
+        return ZstdCompressor(level)
+    return None
@@ -1 +1,3 @@
-from .additions import *
\ No newline at end of file
+from .additions import *
+from .uploads import *
+from .state import *
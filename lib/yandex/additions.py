@@ -1,44 +1,49 @@
-from typing import Tuple, List, Dict, Optional
+import asyncio
+import zlib
+from typing import Tuple, List, Dict, Iterator, Optional
 from os import environ as os_environ
-from tempfile import NamedTemporaryFile
-from base64 import decodebytes
-from zlib import decompress
 from uuid import uuid4
-from itertools import cycle
 from contextlib import AsyncExitStack
 from aiobotocore.session import AioSession
 from lib.util import is_ip
-from lib.util import QUERY_TYPES_ARE_SUPPORTED, abort, access_dot_path
-from lib.core import AppConfig, TargetConfig
+from lib.util import parse_query_types, parse_nameserver_limits, abort, access_dot_path, iter_base64_zlib_lines
+from lib.core import AppConfig, TargetConfig, NameserverScheduler
 
-__all__ = ['parse_args_env']
+__all__ = ['parse_args_env', 'create_default_info_for_routes_bucket', 'get_aws_client', 'close_aws_clients']
 
 CONST_SPECIAL_PREFIX_BUCKET = 'destination_'
 
-
-def unpack_targets_to_str(payload: str) -> Optional[List[str]]:
-    try:
-        bytes_record = payload.encode('utf-8')  # 1. данные приходят в base64
-        zlib_record: bytes = decodebytes(bytes_record)  # 2. из base64 в bytes, которые являются запакованы zlib
-        decompressed_record: bytes = decompress(zlib_record)  # 3. распаковка zlib
-        massive_strings: str = decompressed_record.decode('utf-8')
-        values: List[str] = massive_strings.split('\n')  # for example
-        return values
-    except:
-        pass
-
-
-def parse_sqs_message_yandex(event: Dict) -> Optional[str]:
-    try:
-        message = event['messages'][0]
-        body_current_message = access_dot_path(message, 'details.message.body')
-        records: Optional[List[str]] = unpack_targets_to_str(body_current_message)
-        if records:
-            tmp_file = NamedTemporaryFile(delete=False, mode='wt')
-            tmp_file.write('\n'.join(records)+'\n')
-            return tmp_file.name
-    except Exception as exp:
-        print(exp)
+# clients are created once per process and reused by warm invocations of lambda
+AWS_SESSION: Optional[AioSession] = None
+AWS_EXIT_STACK = AsyncExitStack()
+AWS_CLIENTS: Dict[Tuple, object] = {}
+AWS_LOOP: Optional[asyncio.AbstractEventLoop] = None  # clients are bound to event loop which created them
+
+
+def parse_sqs_messages_yandex(event: Dict, check_bodies: bool = False) \
+        -> List[Tuple[str, Optional[Iterator[str]], Optional[str]]]:
+    """
+    Returns message id, lines of targets and error of every SQS message in event, bodies are decoded lazily
+    while lines are read. Lines are None if message has no body.
+    check_bodies - every body is decoded once in advance (without keeping it), broken messages get error and no lines
+    """
+    messages = []
+    for number, message in enumerate(event.get('messages') or []):
+        message_id, lines, error = str(number), None, None
+        try:
+            message_id = access_dot_path(message, 'details.message.message_id') or message_id
+            body_current_message = (access_dot_path(message, 'details.message') or {}).get('body')
+            if body_current_message:
+                if check_bodies:
+                    for _ in iter_base64_zlib_lines(body_current_message):
+                        pass
+                lines = iter_base64_zlib_lines(body_current_message)  # base64 -> zlib -> text
+        except (ValueError, zlib.error) as exp:
+            error = f'broken message body: {exp}'
+        except Exception as exp:
+            print(exp)
+        messages.append((message_id, lines, error))
+    return messages
 
 
 async def create_aws_client(session: AioSession, exit_stack: AsyncExitStack, auth_struct: Dict):
@@ -47,6 +52,34 @@ async def create_aws_client(session: AioSession, exit_stack: AsyncExitStack, aut
     return client
 
 
+async def get_aws_client(auth_struct: Dict):
+    """
+    Returns client for auth_struct, client is created on first call and kept for next invocations.
+    Clients of previous event loop are closed
+    """
+    global AWS_SESSION, AWS_LOOP
+    if AWS_LOOP is not asyncio.get_running_loop():
+        await close_aws_clients()
+        AWS_LOOP = asyncio.get_running_loop()
+    key = tuple(sorted(auth_struct.items()))
+    client = AWS_CLIENTS.get(key)
+    if client is None:
+        if AWS_SESSION is None:
+            AWS_SESSION = AioSession()
+        client = AWS_CLIENTS[key] = await create_aws_client(AWS_SESSION, AWS_EXIT_STACK, auth_struct=auth_struct)
+        print(f'created Client for {auth_struct["service_name"].upper()}')
+    return client
+
+
+async def close_aws_clients():
+    AWS_CLIENTS.clear()
+    try:
+        await AWS_EXIT_STACK.aclose()
+    except Exception as exp:
+        # connections of closed event loop can not be closed gracefully
+        print(exp)
+
+
 def create_default_info_for_routes_bucket(settings_s3: Dict) -> Dict:
     endpoint = settings_s3['endpoint'].strip('/')
     dest, database, space = endpoint.split('/')
@@ -61,11 +94,13 @@ def create_default_info_for_routes_bucket(settings_s3: Dict) -> Dict:
             'key': s3_prefix_key}
 
 
-async def parse_args_env(event: Dict) -> Tuple[TargetConfig, AppConfig, Dict, Optional[Dict]]:
+async def parse_args_env(event: Dict) -> Tuple[TargetConfig, AppConfig, Dict, Optional[Dict],
+                                               List[Tuple[str, Optional[Iterator[str]], Optional[str]]]]:
 
-    input_file: Optional[str] = parse_sqs_message_yandex(event)
-    if not input_file:
-        abort(f'ERROR: errors when creating input file(temp.)')
+    # merged output of messages fails as a whole, so broken messages are found before merging
+    messages = parse_sqs_messages_yandex(event, check_bodies=os_environ.get('merge_messages', '') == 'True')
+    if not any(lines is not None or error for _, lines, error in messages):
+        abort('ERROR: errors when reading input from messages')
 
     default_nameservers = ['8.8.8.8', '8.8.4.4', '77.88.8.8', '77.88.8.1']
     nameservers = []
@@ -84,14 +119,11 @@ async def parse_args_env(event: Dict) -> Tuple[TargetConfig, AppConfig, Dict, Op
         senders = int(os_environ.get('senders'))
     except:
         pass
-    query_types_are_supported = []
-    if query := os_environ.get('query'):
-        if query in QUERY_TYPES_ARE_SUPPORTED:
-            query_types_are_supported = [query]
+    query = os_environ.get('query')
+    query_types_are_supported = parse_query_types(query)
     if not query_types_are_supported:
         abort(f'ERROR: query type not supported: {query}')
 
-    output_file = f'/tmp/{uuid4().hex}.results'
     # region client s3
     s3_out_struct = {'service_name': 's3',
                      'region_name': os_environ.get('region_name', 'ru-east-1'),
@@ -105,17 +137,20 @@ async def parse_args_env(event: Dict) -> Tuple[TargetConfig, AppConfig, Dict, Op
     keys = ['service_name', 'endpoint_url', 'region_name', 'aws_secret_access_key', 'aws_access_key_id', 'use_ssl']
     init_keys = {k: s3_out_struct.get(k) for k in keys if s3_out_struct.get(k)}
 
-    _session = AioSession()
-    exit_stack = AsyncExitStack()
-    client_s3 = await create_aws_client(_session, exit_stack, auth_struct=init_keys)
-    print('created Client for S3')
+    client_s3 = await get_aws_client(init_keys)
 
     s3 = dict()
     s3['init_keys'] = init_keys
     s3['client'] = client_s3
     s3['endpoint'] = s3_out_struct['endpoint']
-    s3['about_bucket']: Dict = create_default_info_for_routes_bucket(s3)
-    s3['output_file'] = output_file
+    # every message(or all messages with merge_messages) gets own key, see create_default_info_for_routes_bucket
+    s3['merge_messages'] = os_environ.get('merge_messages', '') == 'True'
+    s3['part_size'], s3['upload_concurrency'] = 8 * 1024 * 1024, 4
+    try:
+        s3['part_size'] = int(float(os_environ.get('s3_part_size_mb', 8)) * 1024 * 1024)
+        s3['upload_concurrency'] = int(os_environ.get('s3_upload_concurrency', 4))
+    except:
+        pass
     # endregion
     # region client sqs
     sqs_out_struct = {'service_name': 'sqs',
@@ -130,10 +165,7 @@ async def parse_args_env(event: Dict) -> Tuple[TargetConfig, AppConfig, Dict, Op
         keys = ['service_name', 'endpoint_url', 'region_name', 'aws_secret_access_key', 'aws_access_key_id', 'use_ssl']
         init_keys = {k: sqs_out_struct.get(k) for k in keys if sqs_out_struct.get(k)}
 
-        _session = AioSession()
-        exit_stack = AsyncExitStack()
-        client_sqs = await create_aws_client(_session, exit_stack, auth_struct=init_keys)
-        print('created Client for SQS')
+        client_sqs = await get_aws_client(init_keys)
         sqs = dict()
         sqs['init_keys'] = init_keys
         sqs['client'] = client_sqs
@@ -143,24 +175,81 @@ async def parse_args_env(event: Dict) -> Tuple[TargetConfig, AppConfig, Dict, Op
         print('mode about SQS - not enabled')
 
     # endregion
+    sockets_per_nameserver = 4
+    try:
+        sockets_per_nameserver = int(os_environ.get('sockets_per_nameserver'))
+    except:
+        pass
+    timeout, retries, retry_backoff = 2.0, 1, 0.1
+    try:
+        timeout = float(os_environ.get('timeout', timeout))
+        retries = int(os_environ.get('retries', retries))
+        retry_backoff = float(os_environ.get('retry_backoff', retry_backoff))
+    except:
+        pass
+    qps, max_inflight = 0.0, 0
+    qps_per_nameserver, max_inflight_per_nameserver = {}, {}
+    try:
+        qps = float(os_environ.get('qps', qps))
+        max_inflight = int(os_environ.get('max_inflight', max_inflight))
+        qps_per_nameserver = parse_nameserver_limits(os_environ.get('qps_per_nameserver', ''), float)
+        max_inflight_per_nameserver = parse_nameserver_limits(os_environ.get('max_inflight_per_nameserver', ''), int)
+    except Exception as exp:
+        print(exp)
+    cache_size = 0
+    try:
+        cache_size = int(os_environ.get('cache_size', cache_size))
+    except:
+        pass
+    compress_level = 4
+    try:
+        compress_level = int(os_environ.get('compress_level', compress_level))
+    except:
+        pass
+    edns_bufsize = 1232
+    try:
+        edns_bufsize = int(os_environ.get('edns_bufsize', edns_bufsize))
+        if edns_bufsize:
+            edns_bufsize = min(max(edns_bufsize, 512), 65535)
+    except:
+        pass
     show_only_success = True if os_environ.get('show_only_success', '') == 'True' else False
     app_settings = AppConfig(**{
         'senders': senders,
-        'queue_sleep': 1,
+        'queue_size': senders,
         'statistics': False,
-        'input_file': input_file,
+        'input_file': '',
+        'input_lines': None,  # lines of every message are set by lambda
         'input_stdin': False,
         'single_targets': '',
-        'output_file': output_file,
-        'write_mode': 'a',
+        'output_file': 's3://',  # output is streamed to bucket by S3MultipartWriter, key is set by lambda
+        'write_mode': 'ab',
         'show_only_success': show_only_success,
         'nameservers': nameservers,
         'query_types_are_supported': query_types_are_supported,
-        'timeout': 2,
-        'use_msgpack': False
+        'split_queries': os_environ.get('split_queries', '') == 'True',
+        'timeout': timeout,
+        'retries': retries,
+        'retry_backoff': retry_backoff,
+        'qps': qps,
+        'qps_per_nameserver': qps_per_nameserver,
+        'max_inflight': max_inflight,
+        'max_inflight_per_nameserver': max_inflight_per_nameserver,
+        'cache_size': cache_size,
+        'cache_file': os_environ.get('cache_file'),
+        'output_batch': 5000,
+        'flush_interval': 1.0,
+        'output_format': os_environ.get('output_format', 'json'),
+        'compress': 'gzip',
+        'compress_level': compress_level,
+        'sockets_per_nameserver': sockets_per_nameserver,
+        'transport': 'tcp' if os_environ.get('transport', '') == 'tcp' else 'udp',
+        'edns_bufsize': edns_bufsize
     })
 
     target_settings = TargetConfig(**{
-        'nameservers': cycle(nameservers)
+        'nameservers': NameserverScheduler(nameservers),
+        'query_types': query_types_are_supported,
+        'edns_bufsize': edns_bufsize
     })
-    return target_settings, app_settings, s3, sqs
\ No newline at end of file
+    return target_settings, app_settings, s3, sqs, messages
\ No newline at end of file
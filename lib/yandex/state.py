@@ -0,0 +1,43 @@
+import asyncio
+from dataclasses import replace
+from typing import Optional
+
+from lib.core import AppConfig, TargetConfig
+from lib.workers import Resolver
+
+__all__ = ['ResolverState', 'get_resolver_state']
+
+
+class ResolverState(Resolver):
+    """
+    Resolver components of lambda which survive between warm invocations:
+    sockets and TCP connections, answer cache, nameserver health (scheduler), limits and senders semaphore
+    """
+
+    def __init__(self, target_settings: TargetConfig, config: AppConfig):
+        super().__init__(config)
+        self.config = config
+        self.loop = asyncio.get_running_loop()
+        self.scheduler = target_settings.nameservers
+
+    def target_settings(self, target_settings: TargetConfig) -> TargetConfig:
+        """
+        Returns settings of targets with scheduler of state, so health of nameservers is kept
+        """
+        return replace(target_settings, nameservers=self.scheduler)
+
+
+RESOLVER_STATE: Optional[ResolverState] = None
+
+
+def get_resolver_state(target_settings: TargetConfig, config: AppConfig) -> ResolverState:
+    """
+    Returns state of previous invocation if settings and event loop are the same, otherwise creates new one
+    """
+    global RESOLVER_STATE
+    state = RESOLVER_STATE
+    if state is None or state.config != config or state.loop is not asyncio.get_running_loop():
+        if state:
+            state.close()
+        state = RESOLVER_STATE = ResolverState(target_settings, config)
+    return state
@@ -0,0 +1,102 @@
+import asyncio
+from typing import Dict, List, Optional
+
+__all__ = ['S3MultipartWriter', 'MIN_PART_SIZE']
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum size of every part except the last one
+
+
+class S3MultipartWriter:
+    """
+    Async file-like object for OutputPrinter: streams written data to S3 object.
+    Data is buffered to parts of part_size bytes, parts are uploaded concurrently (up to concurrency)
+    while scan is running. If whole output is smaller than one part it is sent with single put_object.
+    On error multipart upload is aborted
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int = 8 * 1024 * 1024, concurrency: int = 4):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts: Dict[int, str] = {}
+        self.count_parts = 0
+        self.uploading: List[asyncio.Task] = []
+        self.size = 0
+        self.http_status = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.abort()
+
+    async def write(self, data: bytes):
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            await self.start_part(part)
+
+    async def start_part(self, part: bytes):
+        """
+        Waits for free upload slot and starts upload of next part in background
+        """
+        for task in [task for task in self.uploading if task.done()]:
+            task.result()  # re-raise errors of finished uploads early
+            self.uploading.remove(task)
+        if self.upload_id is None:
+            response = await self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+        await self.semaphore.acquire()
+        self.count_parts += 1
+        self.uploading.append(asyncio.create_task(self.upload_part(self.count_parts, part)))
+
+    async def upload_part(self, part_number: int, part: bytes):
+        try:
+            response = await self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                     PartNumber=part_number, Body=part)
+            self.parts[part_number] = response['ETag']
+        finally:
+            self.semaphore.release()
+
+    async def close(self) -> int:
+        """
+        Uploads the rest of buffer and completes upload, returns HTTP status of last request
+        """
+        try:
+            if self.upload_id is None:
+                response = await self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            else:
+                if self.buffer:
+                    await self.start_part(bytes(self.buffer))
+                await asyncio.gather(*self.uploading)
+                parts = [{'PartNumber': number, 'ETag': etag} for number, etag in sorted(self.parts.items())]
+                response = await self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                       UploadId=self.upload_id,
+                                                                       MultipartUpload={'Parts': parts})
+        except BaseException:
+            await self.abort()
+            raise
+        self.buffer = bytearray()
+        self.http_status = response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return self.http_status
+
+    async def abort(self):
+        for task in self.uploading:
+            task.cancel()
+        await asyncio.gather(*self.uploading, return_exceptions=True)
+        self.uploading = []
+        if self.upload_id is not None:
+            try:
+                await self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as exp:
+                print(exp)
+            self.upload_id = None
@@ -6,41 +6,27 @@ import asyncio
 import uvloop
 from aiofiles import open as aiofiles_open
 
-from lib.workers import get_async_writer, create_io_reader, TargetReader, TaskProducer, Executor, OutputPrinter, \
-    TargetWorker
+from lib.workers import Resolver, Checkpoint, run_pipeline, run_sharded
 from lib.util import parse_settings, parse_args
-from lib.core import Stats
+from lib.core import Stats, AppConfig, TargetConfig
 
 
-async def main():
-    arguments = parse_args()
-    target_settings, config = parse_settings(arguments)
-
-    queue_input = asyncio.Queue()
-    queue_tasks = asyncio.Queue()
-    queue_prints = asyncio.Queue()
-
-    task_semaphore = asyncio.Semaphore(config.senders)
-    statistics = Stats() if config.statistics else None
+async def main(target_settings: TargetConfig, config: AppConfig):
+    statistics = Stats(nameservers=target_settings.nameservers) if config.statistics else None
+    resolver = Resolver(config)
+    checkpoint = Checkpoint(config.checkpoint_file, config.resume, config.checkpoint_interval) \
+        if config.checkpoint_file else None
 
     async with aiofiles_open(config.output_file, mode=config.write_mode) as file_with_results:
-        writer_coroutine = get_async_writer(config)
+        await run_pipeline(target_settings, config, resolver, statistics, file_with_results, checkpoint=checkpoint)
+    resolver.close()
 
-        target_worker = TargetWorker(statistics,
-                                     task_semaphore,
-                                     queue_prints,
-                                     config.show_only_success,
-                                     use_msgpack=config.use_msgpack)
-
-        input_reader: TargetReader = create_io_reader(statistics, queue_input, target_settings, config)
-        task_producer = TaskProducer(statistics, queue_input, queue_tasks, target_worker)
-        executor = Executor(statistics, queue_tasks, queue_prints)
-        printer = OutputPrinter(config.output_file, statistics, queue_prints, file_with_results, writer_coroutine)
-
-        running_tasks = [asyncio.create_task(worker.run())
-                         for worker in [input_reader, task_producer, executor, printer]]
-        await asyncio.wait(running_tasks)
 
 if __name__ == '__main__':
-    uvloop.install()
-    asyncio.run(main())
+    arguments = parse_args()
+    target_settings, config = parse_settings(arguments)
+    if config.workers > 1:
+        run_sharded(target_settings, config)
+    else:
+        uvloop.install()
+        asyncio.run(main(target_settings, config))
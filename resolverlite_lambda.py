@@ -4,106 +4,118 @@ __status__ = "Dev"
 
 import asyncio
 import datetime
+from dataclasses import replace
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+from zlib import error as zlib_error
 
 import ujson
 import uvloop
-from aiofiles import open as aiofiles_open
-from os import unlink
-from lib.workers import get_async_writer, create_io_reader, TargetReader, TaskProducer, Executor, OutputPrinter, \
-    TargetWorker
-from gzip import compress as gzip_compress
-from lib.core import Stats
-from lib.yandex import parse_args_env
-
-
-async def main(event, context):
-    target_settings, config, s3_config, sqs_config = await parse_args_env(event)
-    queue_input = asyncio.Queue()
-    queue_tasks = asyncio.Queue()
-    queue_prints = asyncio.Queue()
-
-    task_semaphore = asyncio.Semaphore(config.senders)
-    statistics = Stats() if config.statistics else None
-
-    async with aiofiles_open(config.output_file, mode=config.write_mode) as file_with_results:
-        writer_coroutine = get_async_writer(config)
-
-        target_worker = TargetWorker(statistics,
-                                     task_semaphore,
-                                     queue_prints,
-                                     config.show_only_success,
-                                     use_msgpack=config.use_msgpack)
-
-        input_reader: TargetReader = create_io_reader(statistics, queue_input, target_settings, config)
-        task_producer = TaskProducer(statistics, queue_input, queue_tasks, target_worker)
-        executor = Executor(statistics, queue_tasks, queue_prints)
-        printer = OutputPrinter(config.output_file, statistics, queue_prints, file_with_results, writer_coroutine)
-
-        running_tasks = [asyncio.create_task(worker.run())
-                         for worker in [input_reader, task_producer, executor, printer]]
-        await asyncio.wait(running_tasks)
-
-    # region send file to S3 bucket
-    with open(config.output_file, 'rb') as outfile:
-        data = outfile.read()
-        data_packed = gzip_compress(data, compresslevel=4)
-    # region sending to s3 bucket
-    client_s3 = s3_config['client']
-    bucket = s3_config['about_bucket']['bucket']
-    key_bucket = s3_config['about_bucket']['key']
-    resp_from_s3 = await client_s3.put_object(Bucket=bucket,
-                                              Key=key_bucket,
-                                              Body=data_packed)
+from lib.workers import run_pipeline
+from lib.core import Stats, AppConfig, TargetConfig
+from lib.yandex import parse_args_env, create_default_info_for_routes_bucket, get_resolver_state, \
+    S3MultipartWriter, ResolverState
+
+# event loop is kept between warm invocations, clients and resolver state are bound to it
+EVENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def resolve_to_bucket(lines: Iterable[str], about_bucket: Dict, target_settings: TargetConfig,
+                            config: AppConfig, s3_config: Dict, state: ResolverState,
+                            statistics: Optional[Stats]) -> int:
+    """
+    Resolves lines of targets to one object of S3 bucket, returns HTTP status of upload.
+    Sockets, cache, nameserver health and limits are shared by all pipelines of invocation
+    """
+    bucket, key_bucket = about_bucket['bucket'], about_bucket['key']
+    config = replace(config, input_lines=lines, output_file=f's3://{bucket}/{key_bucket}')
+    # results are streamed to S3 bucket while scan is running, output is compressed by OutputPrinter
+    upload = S3MultipartWriter(s3_config['client'], bucket, key_bucket,
+                               part_size=s3_config['part_size'], concurrency=s3_config['upload_concurrency'])
+    async with upload as file_with_results:
+        await run_pipeline(target_settings, config, state, statistics, file_with_results)
+    return upload.http_status
+
+
+async def send_to_sqs(sqs_config: Dict, about_bucket: Dict, message_ids: List[str]):
+    bucket, key_bucket = about_bucket['bucket'], about_bucket['key']
+    message_sqs = {'bucket': bucket,
+                   'key': key_bucket,
+                   'messages': message_ids,
+                   'timestamp': int(datetime.datetime.now().timestamp())}
+
+    body_message: str = ujson.dumps(message_sqs)
     try:
-        http_status = resp_from_s3['ResponseMetadata']['HTTPStatusCode']
-    except Exception as exp:
-        http_status = 0
-        print(exp)
-    # endregion
-
-    try:
-        await s3_config['client'].close()
-    except Exception as e:
-        print(e)
-        print('errors when closing S3 Client connection')
-
-    # need delete tmp file
-    try:
-        unlink(config.input_file)
-        unlink(config.output_file)
-    except:
-        pass
-
-    # region sending to sqs about file saved to buckets
-    if sqs_config:
-        message_sqs = {'bucket': bucket,
-                       'key': key_bucket,
-                       'timestamp': int(datetime.datetime.now().timestamp())}
-
-        body_message: str = ujson.dumps(message_sqs)
         status = await sqs_config['client'].send_message(QueueUrl=sqs_config['queue_url'],
                                                          MessageBody=body_message)
-        try:
-            status_code: int = status['ResponseMetadata']['HTTPStatusCode']
-            if status_code != 200:
-                print(f'SQS: errors: {status_code}')
-            else:
-                print(f'SQS sent: {bucket}/{key_bucket}')
-        except Exception as error_send:
-            print(f'SQS: error: {error_send}')
-        try:
-            await sqs_config['client'].close()
-        except Exception as e:
-            print(e)
-            print('errors when closing SQS Client connection')
+        status_code: int = status['ResponseMetadata']['HTTPStatusCode']
+        if status_code != 200:
+            print(f'SQS: errors: {status_code}')
+        else:
+            print(f'SQS sent: {bucket}/{key_bucket}')
+    except Exception as error_send:
+        print(f'SQS: error: {error_send}')
+
+
+async def main(event, context) -> List[Dict]:
+    """
+    Resolves targets of all messages of event, every message is uploaded to own key of bucket
+    (or all of them to one key with merge_messages). Returns status of every message,
+    messages with broken body get status 0 and error, with merge_messages they are left out of merged output
+    """
+    target_settings, config, s3_config, sqs_config, messages = await parse_args_env(event)
+    state = get_resolver_state(target_settings, config)
+    target_settings = state.target_settings(target_settings)
+    statistics = Stats(nameservers=target_settings.nameservers) if config.statistics else None
+
+    # region outputs: list of (message ids, lines) -> one object of bucket for each
+    readable = [(message_id, lines) for message_id, lines, _ in messages if lines is not None]
+    if not readable:
+        outputs = []
+    elif s3_config['merge_messages']:
+        outputs = [([message_id for message_id, _ in readable],
+                    chain.from_iterable(lines for _, lines in readable))]
+    else:
+        outputs = [([message_id], lines) for message_id, lines in readable]
+    routes = [create_default_info_for_routes_bucket(s3_config) for _ in outputs]
     # endregion
-
-    return http_status
+    results = await asyncio.gather(*[resolve_to_bucket(lines, about_bucket, target_settings, config, s3_config,
+                                                       state, statistics)
+                                     for (_, lines), about_bucket in zip(outputs, routes)],
+                                   return_exceptions=True)
+    if state.cache:
+        state.cache.save()
+
+    statuses: Dict[str, Dict] = {message_id: {'message_id': message_id, 'status': 0,
+                                              'error': error or 'empty message'}
+                                 for message_id, _, error in messages}
+    for (message_ids, _), about_bucket, result in zip(outputs, routes, results):
+        if isinstance(result, BaseException):
+            # upload is aborted: no object in bucket and no notification
+            print(f'S3: error: {about_bucket["bucket"]}/{about_bucket["key"]}: {result}')
+            error = str(result) or type(result).__name__
+            if isinstance(result, (ValueError, zlib_error)):
+                error = f'broken message body: {error}'
+            for message_id in message_ids:
+                statuses[message_id] = {'message_id': message_id, 'status': 0, 'error': error}
+            continue
+        if sqs_config:
+            await send_to_sqs(sqs_config, about_bucket, message_ids)
+        for message_id in message_ids:
+            statuses[message_id] = {'message_id': message_id, **about_bucket, 'status': result}
+
+    return list(statuses.values())
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    global EVENT_LOOP
+    if EVENT_LOOP is None or EVENT_LOOP.is_closed():
+        EVENT_LOOP = uvloop.new_event_loop()
+        asyncio.set_event_loop(EVENT_LOOP)
+    return EVENT_LOOP
 
 
 def handler(event, context):
-    uvloop.install()
-    s3_status = asyncio.run(main(event, context))
+    statuses = get_event_loop().run_until_complete(main(event, context))
     return {'statusCode': 200,
-            'body': s3_status}
-
+            'body': statuses}
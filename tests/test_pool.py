@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+
+from lib.core import pack_question
+from lib.workers import DnsConnection
+
+
+class BrokenConnection(DnsConnection):
+    """
+    Connection which peer has gone: every send fails, close fails waiting requests
+    """
+
+    async def send(self, packet: bytes):
+        self.close()
+        raise ConnectionResetError('connection reset by peer')
+
+    def close_transport(self):
+        pass
+
+
+class DnsConnectionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failed_send_leaves_no_unretrieved_future(self):
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda _, context: errors.append(context))
+        connection = BrokenConnection()
+        with self.assertRaises(ConnectionResetError):
+            await connection.request(pack_question('example.com'), timeout=0.05)
+        await asyncio.sleep(0.1)  # deadline of requests is over
+        self.assertEqual(connection.pending, {})
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
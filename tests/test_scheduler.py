@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+from time import monotonic
+
+from lib.core import NameserverScheduler, Target
+from lib.workers import NameserverLimits, TargetWorker
+
+
+def eject(scheduler: NameserverScheduler, nameserver: str):
+    scheduler.health[nameserver].ejected_until = monotonic() + 60
+
+
+class NameserverSchedulerTest(unittest.TestCase):
+
+    def test_retry_avoids_ejected_nameserver(self):
+        scheduler = NameserverScheduler(['a', 'b'])
+        eject(scheduler, 'b')
+        self.assertEqual(scheduler.select(exclude='a'), 'a')
+
+    def test_retry_uses_other_nameserver(self):
+        scheduler = NameserverScheduler(['a', 'b', 'c'])
+        eject(scheduler, 'c')
+        self.assertEqual({scheduler.select(exclude='a') for _ in range(20)}, {'b'})
+
+    def test_all_ejected_returns_soonest_back(self):
+        scheduler = NameserverScheduler(['a', 'b'])
+        eject(scheduler, 'a')
+        eject(scheduler, 'b')
+        scheduler.health['b'].ejected_until -= 30
+        self.assertEqual(scheduler.select(exclude='a'), 'b')
+
+    def test_throttled_nameserver_is_not_replaced_with_ejected_one(self):
+        scheduler = NameserverScheduler(['a', 'b'])
+        eject(scheduler, 'b')
+        self.assertIsNone(scheduler.select(exclude='a', available=lambda nameserver: True))
+
+    def test_throttled_nameserver_is_replaced_with_available_one(self):
+        scheduler = NameserverScheduler(['a', 'b', 'c'])
+        eject(scheduler, 'c')
+        self.assertEqual(scheduler.select(exclude='a', available=lambda nameserver: nameserver != 'a'), 'b')
+
+
+class AcquireNameserverTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_query_waits_for_throttled_nameserver_next_to_ejected_one(self):
+        scheduler = NameserverScheduler(['a', 'b'])
+        eject(scheduler, 'b')
+        limits = NameserverLimits(max_inflight_per_nameserver={'a': 1})
+        worker = TargetWorker(None, asyncio.Semaphore(10), asyncio.Queue(), False, scheduler=scheduler, limits=limits)
+        await limits.acquire('a')
+        acquiring = asyncio.create_task(worker.acquire_nameserver(Target('example.com', 'a', b'', 'A')))
+        await asyncio.sleep(0.05)
+        self.assertFalse(acquiring.done())
+        limits.release('a')
+        target = await acquiring
+        self.assertEqual(target.nameserver, 'a')
+        limits.release('a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import unittest
+
+from lib.yandex import S3MultipartWriter, MIN_PART_SIZE
+
+
+class FakeS3Client:
+    """
+    Stand-in for aiobotocore S3 client: keeps parts in memory, later parts are uploaded faster
+    """
+
+    def __init__(self, fail_part: int = 0):
+        self.fail_part = fail_part
+        self.calls = []
+        self.parts = {}
+        self.objects = {}
+        self.uploading = 0
+        self.max_uploading = 0
+
+    async def put_object(self, Bucket, Key, Body):
+        self.calls.append('put_object')
+        self.objects[(Bucket, Key)] = Body
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def create_multipart_upload(self, Bucket, Key):
+        self.calls.append('create_multipart_upload')
+        return {'UploadId': 'upload-1'}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploading += 1
+        self.max_uploading = max(self.max_uploading, self.uploading)
+        try:
+            await asyncio.sleep(0.05 / PartNumber)
+            if PartNumber == self.fail_part:
+                raise ConnectionError('part failed')
+            self.parts[PartNumber] = Body
+            return {'ETag': f'etag-{PartNumber}'}
+        finally:
+            self.uploading -= 1
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        parts = MultipartUpload['Parts']
+        self.completed = parts
+        self.objects[(Bucket, Key)] = b''.join(self.parts[part['PartNumber']] for part in parts)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+
+
+async def write_chunks(writer: S3MultipartWriter, data: bytes, chunk_size: int = 256 * 1024):
+    for position in range(0, len(data), chunk_size):
+        await writer.write(data[position:position + chunk_size])
+
+
+class S3MultipartWriterTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_small_output_is_put_object(self):
+        client = FakeS3Client()
+        async with S3MultipartWriter(client, 'bucket', 'key') as writer:
+            await writer.write(b'first\n')
+            await writer.write(b'second\n')
+        self.assertEqual(client.calls, ['put_object'])
+        self.assertEqual(client.objects[('bucket', 'key')], b'first\nsecond\n')
+        self.assertEqual(writer.http_status, 200)
+
+    async def test_parts_are_completed_in_order(self):
+        client = FakeS3Client()
+        data = os.urandom(4 * MIN_PART_SIZE + 12345)
+        async with S3MultipartWriter(client, 'bucket', 'key', part_size=MIN_PART_SIZE, concurrency=3) as writer:
+            await write_chunks(writer, data)
+        self.assertEqual(client.calls, ['create_multipart_upload', 'complete_multipart_upload'])
+        self.assertEqual(client.completed, [{'PartNumber': number, 'ETag': f'etag-{number}'} for number in range(1, 6)])
+        self.assertEqual(client.objects[('bucket', 'key')], data)
+        self.assertLessEqual(client.max_uploading, 3)
+        self.assertEqual(writer.http_status, 200)
+
+    async def test_failed_part_aborts_upload(self):
+        client = FakeS3Client(fail_part=2)
+        data = os.urandom(3 * MIN_PART_SIZE)
+        with self.assertRaises(ConnectionError):
+            async with S3MultipartWriter(client, 'bucket', 'key', part_size=MIN_PART_SIZE) as writer:
+                await write_chunks(writer, data)
+        self.assertIn('abort_multipart_upload', client.calls)
+        self.assertNotIn('complete_multipart_upload', client.calls)
+        self.assertNotIn(('bucket', 'key'), client.objects)
+        self.assertEqual(writer.http_status, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()